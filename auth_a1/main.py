@@ -1,4 +1,5 @@
 import datetime
+import logging
 import uuid
 from contextlib import asynccontextmanager
 from typing import Annotated, Optional
@@ -12,15 +13,24 @@ from fastapi.security import (
 from passlib.context import CryptContext
 from pydantic import BaseModel
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from redis.asyncio import Redis
 from scalar_fastapi import get_scalar_api_reference
 from sqlalchemy import MetaData
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import Field, SQLModel, select
 
+from common.kv import Backend, kv_backend
+from common.repository import Repository
+from common.revocation import RevocationStore
+from common.schema import Schema
+from common.sqlite import SQLiteDatabase
+
+logger = logging.getLogger(__name__)
+
 # @ 1. Engine
-engine = create_async_engine("sqlite+aiosqlite:///./auth_a1/user.db")
+database = SQLiteDatabase("sqlite+aiosqlite:///./auth_a1/user.db")
+engine = database.write_engine
 auth_a1_meta = MetaData()
+schema = Schema("auth_a1", engine, auth_a1_meta)
 
 # @asynccontextmanager
 # async def lifespan_handler(app: FastAPI):
@@ -34,7 +44,7 @@ auth_a1_meta = MetaData()
 
 # ! 2. session
 
-async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+async_session = database.sessionmaker(class_=AsyncSession, expire_on_commit=False)
 
 
 async def get_session():
@@ -78,6 +88,11 @@ class RedisSettings(BaseSettings):
     redis_host: str
     redis_port: int
     redis_db: int
+    revoked_filter_capacity: int = 100_000
+    revoked_filter_error_rate: float = 0.001
+    # "memory": blocklist in-process, single worker only
+    kv_backend: Backend = "redis"
+    auth_kv_snapshot_path: str | None = None
 
     model_config = _base_config
 
@@ -91,19 +106,27 @@ class SecuritySettings(BaseSettings):
 redis_settings = RedisSettings()
 security_settings = SecuritySettings()
 
-_token_blacklist = Redis(
+_token_blacklist = kv_backend(
+    redis_settings.kv_backend,
+    redis_settings.auth_kv_snapshot_path,
     host=redis_settings.redis_host,
     port=redis_settings.redis_port,
     db=redis_settings.redis_db,
 )
+revoked_tokens = RevocationStore(
+    _token_blacklist,
+    namespace="auth_a1:revoked",
+    filter_capacity=redis_settings.revoked_filter_capacity,
+    filter_error_rate=redis_settings.revoked_filter_error_rate,
+)
 
 
-async def add_jti(jti: str):
-    await _token_blacklist.set(jti, "blacklisted")
+async def add_jti(jti: str, exp: int):
+    await revoked_tokens.revoke(jti, exp)
 
 
 async def check_jti(jti: str):
-    return await _token_blacklist.exists(jti)
+    return await revoked_tokens.is_revoked(jti)
 
 
 # ^ 3.2 utils
@@ -136,11 +159,11 @@ async def check_token(
     if not token or token.strip() == "":
         raise HTTPException(status_code=401, detail="No token provided")
     decoded_token = jwt.decode(token, key=JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-    print("EMAIL", decoded_token.get("email"))
     if decoded_token is None or await check_jti(decoded_token.get("jti")):
         raise HTTPException(
             status_code=401, detail="Token not available or JTI is lost"
         )
+    logger.debug("token accepted", extra={"email": decoded_token.get("email")})
     account = await session.execute(
         select(Account).where(Account.email == decoded_token.get("email"))
     )
@@ -154,15 +177,8 @@ authorizationDependency = Annotated[Account, Depends(check_token)]
 password_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
-class AccountService:
-    def __init__(self, session: sessionDependency):
-        self.session = session
-
-    async def save(self, account: Account):
-        self.session.add(account)
-        await self.session.commit()
-        await self.session.refresh(account)
-        return account
+class AccountService(Repository[Account]):
+    model = Account
 
     async def create(self, account: AccountCreate):
         item = Account(
@@ -172,14 +188,13 @@ class AccountService:
         return await self.save(item)
 
     async def get_by_email(self, email: str):
-        print("----email", email)
         item = await self.session.execute(select(Account).where(Account.email == email))
         return item.scalar_one_or_none()
 
     async def token(self, email, password):
         # $ get account
         account = await self.get_by_email(email)
-        print("account", account)
+        logger.debug("login", extra={"email": email, "found": account is not None})
         pw_check = password_context.verify(password, account.password)  # return bool
         if not account:
             raise HTTPException(status_code=401, detail="Invalid email")
@@ -229,5 +244,5 @@ async def auth_with_service(
 @router.get("/logout")
 async def logout(token: Annotated[str, Depends(oauth2_scheme)]):
     decoded_token = jwt.decode(token, key=JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-    await add_jti(decoded_token.get("jti"))
+    await add_jti(decoded_token.get("jti"), decoded_token["exp"])
     return {"message": "Logout successful", "token": decoded_token["jti"]}
@@ -1,3 +1,4 @@
+import logging
 from datetime import datetime, timedelta
 from typing import Annotated
 
@@ -6,9 +7,15 @@ from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
 from passlib.context import CryptContext
 from pydantic import BaseModel
-from sqlmodel import Field, Session, SQLModel, create_engine
+from sqlmodel import Field, Session, SQLModel
 
-engine = create_engine("sqlite:///auth_b1/db.db")
+from common.sqlite import SQLiteDatabase
+
+logger = logging.getLogger(__name__)
+
+database = SQLiteDatabase("sqlite:///auth_b1/db.db")
+engine = database.write_engine
+SessionLocal = database.sessionmaker(class_=Session)
 
 
 def create_tables():
@@ -16,7 +23,7 @@ def create_tables():
 
 
 def get_session():
-    with Session(engine) as session:
+    with SessionLocal() as session:
         yield session
 
 
@@ -86,7 +93,7 @@ def authenticate_user(
 ):
     # user = session.get(Users, username)
     user = session.query(Users).filter(Users.username == username).first()
-    print("user", user)
+    logger.debug("login", extra={"username": username, "found": user is not None})
     if not user:
         return False
     if not pwd_context.verify(password, user.hashed_password):
@@ -0,0 +1 @@
+# Benchmarks and performance harnesses, run them with `python -m bench.<name>`
@@ -0,0 +1,312 @@
+"""End-to-end request benchmarks over the assembled main.app, in-process.
+
+    uv run python -m bench.asgi
+    uv run python -m bench.asgi --scenario login --scenario list_books -n 500
+    uv run python -m bench.asgi --update-baseline
+
+Requests go through httpx's ASGI transport, no server or sockets. Postgres is
+replaced by a SQLite file and Redis by fakeredis (`uv sync --group dev`).
+Everything runs in a scratch directory, with copies of the data files the
+apps open by relative path, so the tracked .db/.json files are not touched.
+
+For every scenario: requests/s, p50/p95/p99 latency, then a shorter pass
+under tracemalloc for the peak KiB allocated while a request runs and the
+memory blocks still allocated after it (a leak shows up there). Results are
+compared with bench/baselines/asgi.json; the exit status is 1 when a
+scenario got worse than --threshold.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE = Path(__file__).parent / "baselines" / "asgi.json"
+APPS = ("auth_a1", "auth_b1", "book_a1", "htmx_todo_a1", "learning", "shipping_a1", "todo_a1")
+DATA_FILES = (".db", ".json")
+
+PASSWORD = "bench-password"
+
+
+def workdir(tmp: Path) -> None:
+    """Mirror the app directories: data files copied, everything else linked."""
+    for app in APPS:
+        (tmp / app).mkdir()
+        for entry in (ROOT / app).iterdir():
+            if entry.name == "__pycache__" or ".db-" in entry.name:
+                continue
+            if entry.suffix in DATA_FILES:
+                shutil.copy(entry, tmp / app / entry.name)
+            else:
+                (tmp / app / entry.name).symlink_to(entry)
+
+
+def stand_ins(tmp: Path) -> None:
+    """SQLite for the Postgres apps and fakeredis for Redis, before importing them."""
+    try:
+        import fakeredis
+    except ImportError:
+        sys.exit("bench.asgi needs fakeredis: uv sync --group dev")
+    import redis.asyncio
+
+    redis.asyncio.Redis = fakeredis.FakeAsyncRedis
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tmp / 'postgres.db'}"
+    os.environ["SHIPPING_DATABASE_URL"] = f"sqlite+aiosqlite:///{tmp / 'shipping.db'}"
+    os.environ["SCHEMA_MODE"] = "dev"
+
+
+# state: what setup() made (tokens, ids), shared by the scenarios
+Step = Callable[[object, dict, int], Awaitable[object]]
+
+
+async def setup(client) -> dict:
+    from sqlalchemy import update
+    from sqlmodel import SQLModel
+
+    from book_a1.auth import User
+    from book_a1.db import db
+    from htmx_todo_a1.main import SessionLocal, Todo
+
+    # book_a1 users come from Alembic migrations, which are Postgres-only
+    async with db.async_engine.begin() as connection:
+        await connection.run_sync(SQLModel.metadata.create_all)
+
+    email = "bench@example.com"
+    await client.post(
+        "/book_a1/register", json={"username": "bench", "email": email, "password": PASSWORD}
+    )
+    async with db.async_engine.begin() as connection:
+        await connection.execute(update(User).where(User.email == email).values(role="admin"))
+    response = await client.post("/book_a1/login", json={"email": email, "password": PASSWORD})
+    book_token = response.json()["access_token"]
+    books = [
+        {
+            "title": f"Book {i}",
+            "author": f"Author {i % 20}",
+            "publisher": "Bench",
+            "published_date": "2024-01-01",
+            "page_count": 100 + i,
+            "language": "en",
+        }
+        for i in range(100)
+    ]
+    await client.post(
+        "/book_a1/books/bulk", json=books, headers={"Authorization": f"Bearer {book_token}"}
+    )
+
+    await client.post(
+        "/shipping_a1/seller/signup",
+        json={"email": email, "username": "bench", "password": PASSWORD},
+    )
+    response = await client.post(
+        "/shipping_a1/seller/login", data={"username": email, "password": PASSWORD}
+    )
+    seller_token = response.json()["access_token"]
+
+    with SessionLocal() as session:
+        todo = Todo(task="bench", priority=1)
+        session.add(todo)
+        session.commit()
+        todo_id = todo.id
+
+    return {
+        "email": email,
+        "book_auth": {"Authorization": f"Bearer {book_token}"},
+        "seller_auth": {"Authorization": f"Bearer {seller_token}"},
+        "todo_id": todo_id,
+    }
+
+
+async def login(client, state: dict, i: int):
+    return await client.post(
+        "/book_a1/login", json={"email": state["email"], "password": PASSWORD}
+    )
+
+
+async def list_books(client, state: dict, i: int):
+    return await client.get("/book_a1/books/", headers=state["book_auth"])
+
+
+async def create_shipment(client, state: dict, i: int):
+    return await client.post(
+        "/shipping_a1/ship/add",
+        json={"content": f"parcel {i}", "weight": 1.5, "status": "placed", "destination": 1000 + i % 100},
+        headers=state["seller_auth"],
+    )
+
+
+async def htmx_toggle(client, state: dict, i: int):
+    return await client.put("/htmx_todo_a1/toggle", json={"id": state["todo_id"]})
+
+
+async def json_db_write(client, state: dict, i: int):
+    return await client.post(
+        "/learning/json_db/", json={"id": i % 100, "item": f"item {i}", "complete": i % 2 == 0}
+    )
+
+
+SCENARIOS: dict[str, Step] = {
+    "login": login,
+    "list_books": list_books,
+    "create_shipment": create_shipment,
+    "htmx_toggle": htmx_toggle,
+    "json_db_write": json_db_write,
+}
+
+
+async def call(step: Step, client, state: dict, i: int) -> None:
+    response = await step(client, state, i)
+    if response.status_code >= 400:
+        raise RuntimeError(f"{step.__name__}: {response.status_code} {response.text[:200]}")
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    return sorted_values[min(int(len(sorted_values) * p), len(sorted_values) - 1)]
+
+
+async def measure(step: Step, client, state: dict, args: argparse.Namespace) -> dict:
+    for i in range(args.warmup):
+        await call(step, client, state, i)
+
+    latencies: list[float] = []
+
+    async def worker(ids: range) -> None:
+        for i in ids:
+            started = time.perf_counter()
+            await call(step, client, state, i)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(worker(range(w, args.requests, args.concurrency)) for w in range(args.concurrency))
+    )
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    peaks = []
+    gc.collect()
+    tracemalloc.start()
+    blocks = sys.getallocatedblocks()
+    for i in range(args.alloc_requests):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        await call(step, client, state, i)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    gc.collect()
+    retained = (sys.getallocatedblocks() - blocks) / args.alloc_requests
+    tracemalloc.stop()
+
+    return {
+        "rps": args.requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "peak_kib": statistics.median(peaks) / 1024,
+        "retained_blocks": retained,
+    }
+
+
+def regressions(results: dict, baseline: dict, threshold: float) -> list[str]:
+    found = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if result["rps"] < base["rps"] * (1 - threshold):
+            found.append(f"{name}: {result['rps']:,.0f} req/s, baseline {base['rps']:,.0f}")
+        # p99 is reported, not gated: a few hundred samples make it noisy
+        for key in ("p95_ms", "peak_kib"):
+            if result[key] > base[key] * (1 + threshold):
+                found.append(f"{name}: {key} {result[key]:,.2f}, baseline {base[key]:,.2f}")
+    return found
+
+
+def report(results: dict, baseline: dict) -> None:
+    print(
+        f"{'scenario':<16} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'peak KiB':>9} {'blocks':>7}  vs baseline"
+    )
+    for name, r in results.items():
+        base = baseline.get(name)
+        change = f"{r['rps'] / base['rps'] - 1:+.0%} req/s" if base else "-"
+        print(
+            f"{name:<16} {r['rps']:>8,.0f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} "
+            f"{r['p99_ms']:>8.2f} {r['peak_kib']:>9.1f} {r['retained_blocks']:>7.1f}  {change}"
+        )
+
+
+async def run(args: argparse.Namespace, tmp: Path) -> dict:
+    import httpx
+
+    import main
+    from common.schema import registry
+
+    # echo=True on the app engines would time the logging
+    for schema in registry:
+        schema.engine.echo = False
+    # and so would httpx's line per request of the bench client
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    results = {}
+    async with main.async_lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            state = await setup(client)
+            for name in args.scenario or SCENARIOS:
+                results[name] = await measure(SCENARIOS[name], client, state, args)
+    return results
+
+
+def main(args: argparse.Namespace) -> int:
+    baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        workdir(tmp)
+        stand_ins(tmp)
+        sys.path.insert(0, str(ROOT))
+        os.chdir(tmp)
+        try:
+            # the handlers print, keep that out of the report
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                results = asyncio.run(run(args, tmp))
+        finally:
+            os.chdir(cwd)
+
+    report(results, baseline)
+    if args.update_baseline:
+        BASELINE.parent.mkdir(exist_ok=True)
+        baseline.update({name: {k: round(v, 3) for k, v in r.items()} for name, r in results.items()})
+        BASELINE.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"baseline written to {BASELINE.relative_to(ROOT)}")
+        return 0
+    found = regressions(results, baseline, args.threshold)
+    for line in found:
+        print(f"REGRESSION {line}")
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS))
+    parser.add_argument("-n", "--requests", type=int, default=300)
+    parser.add_argument("-c", "--concurrency", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--alloc-requests", type=int, default=30)
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--update-baseline", action="store_true")
+    sys.exit(main(parser.parse_args()))
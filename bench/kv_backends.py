@@ -0,0 +1,83 @@
+"""Blocklist latency on the two KV backends, Redis and the in-process store.
+
+Needs a running Redis (`./dev.sh redis`), or --fake for fakeredis (no network
+hop, so it understates what Redis costs):
+
+    uv run python -m bench.kv_backends --calls 20000 --revoked 10000
+
+Both stores run without the Bloom filter, so every is_revoked() reaches the
+backend. Half of the checked ids are revoked.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+from redis.asyncio import Redis
+
+from common.kv import MemoryStore
+from common.revocation import RevocationStore
+
+
+async def timed(calls) -> list[float]:
+    latencies = []
+    for call in calls:
+        start = time.perf_counter()
+        await call()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return latencies
+
+
+def line(name: str, latencies: list[float]) -> str:
+    p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+    return (
+        f"{name:<20} p50 {statistics.median(latencies) * 1e6:8.1f} us"
+        f"   p99 {p99 * 1e6:8.1f} us   {len(latencies) / sum(latencies):10.0f} ops/s"
+    )
+
+
+async def measure(name: str, redis, args: argparse.Namespace) -> None:
+    namespace = f"bench:{uuid.uuid4().hex[:8]}:revoked"
+    store = RevocationStore(redis, namespace)
+    exp = time.time() + 600
+    revoked = [str(uuid.uuid4()) for _ in range(args.revoked)]
+    await store.revoke_many((jti, exp) for jti in revoked)
+
+    fresh = [str(uuid.uuid4()) for _ in range(args.calls)]
+    checked = [revoked[i % len(revoked)] if i % 2 else fresh[i] for i in range(args.calls)]
+    revoke = await timed(lambda jti=jti: store.revoke(jti, exp) for jti in fresh)
+    check = await timed(lambda jti=jti: store.is_revoked(jti) for jti in checked)
+
+    print(line(f"{name} revoke", revoke))
+    print(line(f"{name} is_revoked", check))
+
+    if isinstance(redis, Redis):
+        async for key in redis.scan_iter(f"{namespace}:*", 1000):
+            await redis.delete(key)
+
+
+async def main(args: argparse.Namespace):
+    if args.fake:
+        import fakeredis
+
+        redis = fakeredis.FakeAsyncRedis()
+    else:
+        redis = Redis(host=args.host, port=args.port, db=args.db)
+    print(f"revoked ids {args.revoked}, {args.calls} calls each")
+    await measure("redis", redis, args)
+    await redis.aclose()
+    await measure("memory", MemoryStore(), args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--db", type=int, default=0)
+    parser.add_argument("--fake", action="store_true", help="fakeredis instead of a server")
+    parser.add_argument("--calls", type=int, default=20_000)
+    parser.add_argument("--revoked", type=int, default=10_000)
+    asyncio.run(main(parser.parse_args()))
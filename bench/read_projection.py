@@ -0,0 +1,171 @@
+"""CPU and memory per list response: ORM instances vs column projections.
+
+    uv run python -m bench.read_projection --rows 10000 --repeat 5
+    uv run python -m bench.read_projection --book-fields title,author,page_count
+
+For books, shipments and todos a small app serves the same rows two ways:
+`orm` is the old route (select the model, return the instances, let the
+response_model or jsonable_encoder serialize them) and `rows` is the
+common.projection path the apps use now. `fields` is `rows` with the sparse
+fieldset a mobile client asks for (--book-fields, --shipment-fields), which
+shrinks the SELECT and the payload. The data lives in scratch SQLite
+files. Each response is timed with process_time (CPU of this process: ORM,
+validation, encoding) and measured once more under tracemalloc for the peak.
+"""
+
+import argparse
+import asyncio
+import datetime
+import statistics
+import tempfile
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+from typing import Annotated
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+
+from book_a1.book import Book
+from common.projection import FieldSet, Projection, json_response
+from shipping_a1.ship import Shipment, ShipmentStatus
+from todo_a1.db import Base, Todos
+from todo_a1.todo import todo_rows
+
+
+def seed(tmp: Path, rows: int):
+    now = datetime.datetime.now()
+    books = create_async_engine(f"sqlite+aiosqlite:///{tmp / 'books.db'}")
+    shipments = create_async_engine(f"sqlite+aiosqlite:///{tmp / 'shipments.db'}")
+    todos = create_engine(f"sqlite:///{tmp / 'todos.db'}")
+
+    async def fill():
+        async with books.begin() as connection:
+            await connection.run_sync(Book.metadata.create_all, tables=[Book.__table__])
+            await connection.execute(
+                insert(Book.__table__),
+                [
+                    {
+                        "uid": uuid.uuid4(), "title": f"Book {i}", "author": f"Author {i % 100}",
+                        "publisher": "Bench", "published_date": "2024-01-01", "page_count": i,
+                        "language": "en", "created_at": now, "update_at": now,
+                    }
+                    for i in range(rows)
+                ],
+            )
+        async with shipments.begin() as connection:
+            await connection.run_sync(Shipment.metadata.create_all, tables=[Shipment.__table__])
+            await connection.execute(
+                insert(Shipment.__table__),
+                [
+                    {
+                        "id": i, "content": f"parcel {i}", "weight": 1.5, "destination": 1000 + i % 100,
+                        "status": ShipmentStatus.placed, "estimated_delivery": now,
+                    }
+                    for i in range(1, rows + 1)
+                ],
+            )
+
+    asyncio.run(fill())
+    Base.metadata.create_all(todos, tables=[Todos.__table__])
+    with todos.begin() as connection:
+        connection.execute(
+            insert(Todos.__table__),
+            [
+                {"title": f"todo {i}", "description": "bench", "priority": 1 + i % 5, "complete": i % 2 == 0}
+                for i in range(rows)
+            ],
+        )
+    return books, shipments, todos
+
+
+def build_app(books, shipments, todos) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/books/orm", response_model=list[Book])
+    async def books_orm():
+        async with AsyncSession(books) as session:
+            result = await session.execute(select(Book).order_by(Book.created_at))
+            return result.scalars().all()
+
+    @app.get("/books/rows", response_model=list[Book])
+    async def books_rows(fields: Annotated[Projection, Depends(FieldSet(Book))]):
+        async with AsyncSession(books) as session:
+            return json_response(
+                await fields.all(session, fields.statement.order_by(Book.created_at))
+            )
+
+    @app.get("/shipments/orm")
+    async def shipments_orm() -> list[Shipment]:
+        async with AsyncSession(shipments) as session:
+            return (await session.execute(select(Shipment))).scalars().all()
+
+    @app.get("/shipments/rows")
+    async def shipments_rows(
+        fields: Annotated[Projection, Depends(FieldSet(Shipment))],
+    ) -> list[Shipment]:
+        async with AsyncSession(shipments) as session:
+            return json_response(await fields.all(session))
+
+    @app.get("/todos/orm")
+    async def todos_orm():
+        with Session(todos) as session:
+            return session.query(Todos).all()
+
+    @app.get("/todos/rows")
+    async def todos_rows():
+        with Session(todos) as session:
+            return json_response(todo_rows.all_sync(session))
+
+    return app
+
+
+async def measure(client: httpx.AsyncClient, path: str, repeat: int) -> dict:
+    await client.get(path)
+    cpu = []
+    for _ in range(repeat):
+        started = time.process_time()
+        response = await client.get(path)
+        cpu.append(time.process_time() - started)
+    tracemalloc.start()
+    await client.get(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"cpu_ms": statistics.median(cpu) * 1000, "peak_mib": peak / 2**20, "bytes": len(response.content)}
+
+
+async def run(app: FastAPI, args: argparse.Namespace) -> None:
+    transport = httpx.ASGITransport(app=app)
+    sparse = {"books": args.book_fields, "shipments": args.shipment_fields, "todos": None}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"{'route':<10} {'path':<7} {'cpu ms':>8} {'peak MiB':>9} {'body KiB':>9}")
+        for name, fields in sparse.items():
+            paths = {"orm": f"/{name}/orm", "rows": f"/{name}/rows"}
+            if fields:
+                paths["fields"] = f"/{name}/rows?fields={fields}"
+            for label, path in paths.items():
+                r = await measure(client, path, args.repeat)
+                print(
+                    f"{name:<10} {label:<7} {r['cpu_ms']:>8.1f} {r['peak_mib']:>9.1f}"
+                    f" {r['bytes'] / 1024:>9.0f}"
+                )
+
+
+def main(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        books, shipments, todos = seed(Path(tmp), args.rows)
+        print(f"{args.rows} rows per response, median of {args.repeat}")
+        asyncio.run(run(build_app(books, shipments, todos), args))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--book-fields", default="title,author")
+    parser.add_argument("--shipment-fields", default="status,estimated_delivery")
+    main(parser.parse_args())
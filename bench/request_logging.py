@@ -0,0 +1,128 @@
+"""Latency of an authenticated route logging with print() vs common.logs.
+
+    uv run python -m bench.request_logging --requests 5000
+    uv run python -m bench.request_logging --reader-delay 0.01
+
+The route decodes a JWT in a dependency and logs what the bearer classes used
+to print: the scheme, the token and the decoded claims. Output goes to a pipe
+read by a child process, like stdout under a container runtime;
+--reader-delay makes that reader slow, so the pipe fills up and print()
+blocks the event loop, while the queue handler drops what doesn't fit.
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from typing import Annotated
+
+import httpx
+import jwt
+from fastapi import Depends, FastAPI, Request
+
+from common import logs
+
+SECRET = "bench-secret"
+READER = """
+import sys, time
+delay = float(sys.argv[1])
+while sys.stdin.buffer.read1(4096):
+    time.sleep(delay)
+"""
+
+logger = logging.getLogger("bench.request_logging")
+
+
+def build_app(mode: str, sink) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(logs.RequestContext)
+
+    async def bearer(request: Request) -> dict:
+        token = request.headers["authorization"].split(" ", 1)[1]
+        data = jwt.decode(token, SECRET, algorithms=["HS256"])
+        if mode == "print":
+            print("scheme: Bearer", file=sink)
+            print(f"credentials: {token}", file=sink)
+            print(f"DEBUG - Decoded token data: {data}", file=sink)
+        else:
+            logger.debug("token accepted", extra={"jti": data["jti"], "email": data["email"]})
+        return data
+
+    @app.get("/me")
+    async def me(token: Annotated[dict, Depends(bearer)]):
+        return {"email": token["email"]}
+
+    return app
+
+
+async def run(app: FastAPI, requests: int, concurrency: int) -> tuple[list[float], float]:
+    token = jwt.encode(
+        {"email": "bench@example.com", "jti": str(uuid.uuid4()), "exp": time.time() + 3600},
+        SECRET,
+        algorithm="HS256",
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+    latencies: list[float] = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def worker(n: int):
+            for _ in range(n):
+                start = time.perf_counter()
+                response = await client.get("/me", headers=headers)
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(requests // concurrency) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return latencies, elapsed
+
+
+def measure(mode: str, sample: float, args: argparse.Namespace) -> tuple[list[float], float]:
+    reader = subprocess.Popen(
+        [sys.executable, "-c", READER, str(args.reader_delay)], stdin=subprocess.PIPE
+    )
+    # line buffered, as stdout is with PYTHONUNBUFFERED or on a terminal
+    sink = open(reader.stdin.fileno(), "w", buffering=1, closefd=False)
+    if mode == "logs":
+        logs.settings.LOG_LEVEL = "DEBUG"
+        logs.settings.LOG_DEBUG_SAMPLE = sample
+        logs.start(sink)
+    try:
+        return asyncio.run(run(build_app(mode, sink), args.requests, args.concurrency))
+    finally:
+        logs.stop()
+        sink.close()
+        reader.stdin.close()
+        reader.wait()
+
+
+def main(args: argparse.Namespace):
+    runs = {
+        "print": ("print", 1.0),
+        "logs, all debug": ("logs", 1.0),
+        f"logs, {args.sample:g} debug": ("logs", args.sample),
+    }
+    print(f"{args.requests} requests, concurrency {args.concurrency}, reader delay {args.reader_delay}s")
+    for name, (mode, sample) in runs.items():
+        latencies, elapsed = measure(mode, sample, args)
+        p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+        print(
+            f"{name:<20} p50 {statistics.median(latencies) * 1000:7.3f} ms"
+            f"   p99 {p99 * 1000:7.3f} ms   {len(latencies) / elapsed:8.0f} req/s"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--reader-delay", type=float, default=0.0)
+    parser.add_argument("--sample", type=float, default=0.01)
+    main(parser.parse_args())
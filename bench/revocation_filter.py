@@ -0,0 +1,91 @@
+"""Authenticated requests/s with and without the local revocation filter.
+
+Needs a running Redis (`./dev.sh redis`):
+
+    uv run python -m bench.revocation_filter --requests 5000 --revoked 10000
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+from typing import Annotated
+
+import httpx
+from fastapi import Depends, FastAPI, Header, HTTPException
+from redis.asyncio import Redis
+
+from common.revocation import RevocationStore
+
+
+def build_app(store: RevocationStore) -> FastAPI:
+    app = FastAPI()
+
+    async def check(x_jti: Annotated[str, Header()]):
+        if await store.is_revoked(x_jti):
+            raise HTTPException(status_code=403, detail="revoked")
+
+    @app.get("/", dependencies=[Depends(check)])
+    async def index():
+        return {"ok": True}
+
+    return app
+
+
+async def run(store: RevocationStore, requests: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=build_app(store))
+    jtis = [str(uuid.uuid4()) for _ in range(requests)]
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def worker(chunk: list[str]):
+            for jti in chunk:
+                response = await client.get("/", headers={"x-jti": jti})
+                assert response.status_code == 200
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(jtis[i::concurrency]) for i in range(concurrency)))
+        return requests / (time.perf_counter() - start)
+
+
+async def main(args: argparse.Namespace):
+    redis = Redis(host=args.host, port=args.port, db=args.db)
+    namespace = f"bench:{uuid.uuid4().hex[:8]}:revoked"
+    exp = time.time() + 600
+    plain = RevocationStore(redis, namespace)
+    await plain.revoke_many((str(uuid.uuid4()), exp) for _ in range(args.revoked))
+
+    filtered = RevocationStore(
+        redis,
+        namespace,
+        filter_capacity=max(args.revoked * 2, 1),
+        filter_error_rate=args.error_rate,
+    )
+    await filtered.start()
+    while filtered._filter is None:
+        await asyncio.sleep(0.01)
+
+    without = await run(plain, args.requests, args.concurrency)
+    with_filter = await run(filtered, args.requests, args.concurrency)
+    stats = await filtered.stats()
+    await filtered.stop()
+
+    async for key in redis.scan_iter(f"{namespace}:*", 1000):
+        await redis.delete(key)
+    await redis.aclose()
+
+    print(f"revoked ids      {args.revoked}")
+    print(f"filter size      {stats['filter_bytes']} bytes, fp rate {args.error_rate}")
+    print(f"without filter   {without:10.0f} req/s")
+    print(f"with filter      {with_filter:10.0f} req/s  (x{with_filter / without:.2f})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--db", type=int, default=0)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--revoked", type=int, default=10_000)
+    parser.add_argument("--error-rate", type=float, default=0.001)
+    asyncio.run(main(parser.parse_args()))
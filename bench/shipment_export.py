@@ -0,0 +1,98 @@
+"""Throughput and peak memory of the shipment export over a large table.
+
+    uv run python -m bench.shipment_export --rows 10000000
+
+Seeds a SQLite file (kept in --path between runs) and streams it out in every
+format to a byte counter. Peak RSS is for the whole process, compare it with
+the baseline printed before the exports.
+"""
+
+import argparse
+import asyncio
+import datetime
+import random
+import resource
+import sqlite3
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from shipping_a1.db import shipping_a1_meta
+from shipping_a1.export import ExportFilter, ShipmentExport
+from shipping_a1.ship import ShipmentStatus
+
+STATUSES = [s.value for s in ShipmentStatus]
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def seed(path: Path, rows: int, batch_size: int = 50_000) -> None:
+    if path.exists():
+        with sqlite3.connect(path) as connection:
+            if connection.execute("SELECT count(*) FROM shipment").fetchone()[0] == rows:
+                return
+        path.unlink()
+    engine = create_engine(f"sqlite:///{path}")
+    shipping_a1_meta.create_all(engine)
+    engine.dispose()
+    start = datetime.datetime(2026, 1, 1)
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = OFF")
+    for offset in range(0, rows, batch_size):
+        connection.executemany(
+            "INSERT INTO shipment (id, content, weight, destination, status, estimated_delivery)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    i,
+                    f"parcel {i}",
+                    round(random.uniform(0.1, 24.9), 2),
+                    random.randint(1000, 9999),
+                    random.choice(STATUSES),
+                    str(start + datetime.timedelta(seconds=i)),
+                )
+                for i in range(offset + 1, min(offset + batch_size, rows) + 1)
+            ),
+        )
+        connection.commit()
+    connection.close()
+
+
+async def run(path: Path, batch_size: int) -> None:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    sessionmaker = async_sessionmaker(engine)
+    print(f"baseline RSS {peak_rss_mb():,.0f} MB")
+    for format, gzip in (("csv", False), ("ndjson", False), ("csv", True)):
+        export = ShipmentExport(ExportFilter(format=format, gzip=gzip), [sessionmaker], batch_size)
+        started = time.perf_counter()
+        written = 0
+        async for chunk in export.stream():
+            written += len(chunk)
+        elapsed = time.perf_counter() - started
+        label = format + (".gz" if gzip else "")
+        print(
+            f"{label:<8} {export.rows:>12,} rows {written / 1e6:>9,.0f} MB {elapsed:7.1f}s "
+            f"{export.rows / elapsed:>10,.0f} rows/s  peak RSS {peak_rss_mb():,.0f} MB"
+        )
+    await engine.dispose()
+
+
+def main(args: argparse.Namespace):
+    path = Path(args.path)
+    started = time.perf_counter()
+    seed(path, args.rows)
+    print(f"{args.rows:,} rows ready in {time.perf_counter() - started:.0f}s")
+    asyncio.run(run(path, args.batch_size))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--path", default="/tmp/shipment_export.db")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    main(parser.parse_args())
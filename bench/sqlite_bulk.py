@@ -0,0 +1,74 @@
+"""Import/export throughput of sqlite.bulk against the 1M rows/minute target.
+
+    uv run python -m bench.sqlite_bulk --rows 1000000
+
+Runs on a scratch copy of the schema with an index on users.email, importing
+once with the index in place and once with --drop-indexes.
+"""
+
+import argparse
+import csv
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from common.sqlite import connect
+from sqlite.bulk import export_rows, import_rows
+from sqlite.db import create_tables
+
+TARGET = 1_000_000
+
+
+def make_file(path: Path, format: str, rows: int) -> None:
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        if format == "csv":
+            writer = csv.writer(file)
+            writer.writerow(["id", "name", "email"])
+            writer.writerows((i, f"user {i}", f"user{i}@example.com") for i in range(1, rows + 1))
+        else:
+            file.writelines(
+                json.dumps({"id": i, "name": f"user {i}", "email": f"user{i}@example.com"}) + "\n"
+                for i in range(1, rows + 1)
+            )
+
+
+def timed(action: str, call) -> None:
+    started = time.perf_counter()
+    count = call()
+    elapsed = time.perf_counter() - started
+    per_minute = count / elapsed * 60
+    verdict = "ok" if per_minute >= TARGET else "below target"
+    print(f"{action:<32} {count:>10,} rows {elapsed:6.1f}s {per_minute:>14,.0f} rows/min  {verdict}")
+
+
+def main(args: argparse.Namespace):
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        for format in ("csv", "ndjson"):
+            source = tmp / f"users.{format}"
+            make_file(source, format, args.rows)
+            for drop_indexes in (False, True):
+                database = tmp / f"{format}-{drop_indexes}.db"
+                connection = connect(str(database))
+                create_tables(connection)
+                connection.execute("CREATE INDEX ix_users_email ON users (email)")
+                with open(source, newline="", encoding="utf-8") as file:
+                    label = f"import {format}" + (" --drop-indexes" if drop_indexes else "")
+                    timed(label, lambda: import_rows(
+                        connection, "users", file, format, args.batch_size, drop_indexes
+                    ))
+                with open(tmp / f"out.{format}", "w", newline="", encoding="utf-8") as file:
+                    timed(f"export {format}", lambda: export_rows(
+                        connection, "users", file, format, args.batch_size
+                    ))
+                connection.close()
+            print(f"{format} file: {os.path.getsize(source) / 1e6:.0f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=TARGET)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    main(parser.parse_args())
@@ -0,0 +1,115 @@
+"""Concurrent read/write throughput on SQLite: default settings vs common.sqlite.
+
+Threads, like the sync apps running in FastAPI's threadpool:
+
+    uv run python -m bench.sqlite_profile --readers 8 --writers 4 --seconds 5
+"""
+
+import argparse
+import random
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, sessionmaker
+
+from common.sqlite import SQLiteDatabase
+
+metadata = MetaData()
+items = Table(
+    "items",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("value", String),
+)
+
+
+def default_sessions(url: str):
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    return engine, sessionmaker(engine)
+
+
+def profiled_sessions(url: str):
+    database = SQLiteDatabase(url)
+    return database.write_engine, database.sessionmaker(class_=Session)
+
+
+def run(make_sessions, readers: int, writers: int, seconds: float, seed_rows: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        engine, sessions = make_sessions(url)
+        metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(items), [{"value": "x" * 64} for _ in range(seed_rows)])
+
+        stop = time.perf_counter() + seconds
+        reads, writes, errors, latencies = [0], [0], [0], []
+        lock = threading.Lock()
+
+        def reader():
+            n = 0
+            while time.perf_counter() < stop:
+                try:
+                    with sessions() as session:
+                        session.execute(
+                            select(items).where(items.c.id == random.randint(1, seed_rows))
+                        ).all()
+                    n += 1
+                except OperationalError:
+                    with lock:
+                        errors[0] += 1
+            with lock:
+                reads[0] += n
+
+        def writer():
+            n, mine = 0, []
+            while time.perf_counter() < stop:
+                start = time.perf_counter()
+                try:
+                    with sessions() as session:
+                        session.execute(insert(items).values(value="y" * 64))
+                        session.commit()
+                    n += 1
+                    mine.append(time.perf_counter() - start)
+                except OperationalError:
+                    with lock:
+                        errors[0] += 1
+            with lock:
+                writes[0] += n
+                latencies.extend(mine)
+
+        threads = [threading.Thread(target=reader) for _ in range(readers)]
+        threads += [threading.Thread(target=writer) for _ in range(writers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        engine.dispose()
+
+    latencies.sort()
+    return {
+        "reads/s": reads[0] / seconds,
+        "writes/s": writes[0] / seconds,
+        "errors": errors[0],
+        "write p50 ms": statistics.median(latencies) * 1000 if latencies else 0,
+        "write p99 ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0,
+    }
+
+
+def main(args: argparse.Namespace):
+    for name, make_sessions in (("default", default_sessions), ("profile", profiled_sessions)):
+        result = run(make_sessions, args.readers, args.writers, args.seconds, args.rows)
+        print(f"{name:<8} " + "  ".join(f"{k} {v:,.1f}" for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--rows", type=int, default=10_000)
+    main(parser.parse_args())
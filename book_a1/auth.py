@@ -1,3 +1,4 @@
+import logging
 import uuid
 from datetime import datetime, timedelta, timezone
 from typing import Annotated, List
@@ -13,11 +14,16 @@ from sqlmodel import Column, Field, SQLModel, select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from book_a1.db import (
-    add_jti_blocklist,
+    add_jtis_blocklist,
     db,
+    revoked_tokens,
     settings,
     token_in_blocklist,
 )
+from common.jobs import jobs
+from common.repository import Repository
+
+logger = logging.getLogger(__name__)
 
 # test refresh => curl -X POST http://127.0.0.1:8000/book_a1/refresh -H "Authorization: Bearer <REFRESH TOKEN>"
 session_dep = Annotated[AsyncSession, Depends(db)]
@@ -89,8 +95,6 @@ class TokenBearer(HTTPBearer):
 
     async def __call__(self, request: Request) -> dict:
         credentials = await super().__call__(request)
-        print(f"scheme: {credentials.scheme}")
-        print(f"credentials: {credentials.credentials}")
         token_data = self.verify_token(credentials.credentials)
         if not token_data:
             raise HTTPException(status_code=403, detail="Invalid or expired token")
@@ -98,7 +102,10 @@ class TokenBearer(HTTPBearer):
             raise HTTPException(
                 status_code=403, detail="Token has been revoked, obtain new token"
             )
-        print(f"DEBUG - Decoded token data: {token_data}")
+        logger.debug(
+            "token accepted",
+            extra={"jti": token_data["jti"], "email": token_data.get("email")},
+        )
         return token_data
 
 
@@ -135,7 +142,7 @@ class User(SQLModel, table=True):
         default_factory=uuid.uuid4,
     )
     username: str
-    email: str
+    email: str = Field(index=True)
     password: str
     first_name: str | None = None
     last_name: str | None = None
@@ -187,9 +194,8 @@ class UserRead(SQLModel):
     updated_at: datetime
 
 
-class UserService:
-    def __init__(self, session: session_dep):
-        self.session = session
+class UserService(Repository[User]):
+    model = User
 
     async def get_user_by_username(self, username: str):
         result = await self.session.execute(
@@ -207,10 +213,7 @@ class UserService:
         return True if user else False
 
     async def save_user(self, user: User):
-        self.session.add(user)
-        await self.session.commit()
-        await self.session.refresh(user)
-        return user
+        return await self.save(user)
 
     async def create_user(self, user_create: UserCreateModel):
         hashed_password = generate_password_hash(user_create.password)
@@ -231,7 +234,6 @@ async def get_current_user(
     token_details: Annotated[dict, Depends(access_token_bearer)], session: session_dep
 ):
     user_email = token_details["email"]
-    print(f"DEBUG - token_details: {token_details}")
     user = await UserService(session).get_user_by_email(user_email)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
@@ -249,7 +251,9 @@ async def register(user_create: UserCreateModel, session: session_dep):
     user_exists = await user_service.user_exists(user_create.email)
     if user_exists:
         raise HTTPException(status_code=409, detail="user already exists")
-    return await user_service.create_user(user_create)
+    user = await user_service.create_user(user_create)
+    await jobs.enqueue("book_a1.user_registered", uid=str(user.uuid), email=user.email)
+    return user
 
 
 @router.post("/login")
@@ -308,9 +312,10 @@ async def refresh_token(request: RefreshTokenRequest):
     # Decode and validate the refresh token
     token_data = decode_access_token(request.refresh_token)
 
-    # Debug: print token data
-    print(f"DEBUG - Token data: {token_data}")
-    print(f"DEBUG - refresh field value: {token_data.get('refresh')}")
+    logger.debug(
+        "refresh token",
+        extra={"jti": token_data.get("jti"), "refresh": token_data.get("refresh")},
+    )
 
     # Check if it's actually a refresh token
     if not token_data.get("refresh"):
@@ -318,10 +323,11 @@ async def refresh_token(request: RefreshTokenRequest):
             status_code=401,
             detail=f"Invalid token type. Expected refresh token, got refresh={token_data.get('refresh')}",
         )
+    if await token_in_blocklist(token_data["jti"]):
+        raise HTTPException(status_code=401, detail="Token revoked")
 
     # Check if token is expired (already handled by decode_access_token, but double-checking)
     expiry_timestamp = token_data.get("exp")
-    print(f"expiry_timestamp: {expiry_timestamp}")
 
     # Create new access token
     new_access_token = create_access_token(
@@ -349,12 +355,30 @@ async def refresh_token(request: RefreshTokenRequest):
         },
     }
 
+class LogoutRequest(BaseModel):
+    refresh_token: str | None = None
+
+
 @router.post("/logout")
-async def logout(token_data: dict = Depends(access_token_bearer)):
+async def logout(
+    request: LogoutRequest | None = None,
+    token_data: dict = Depends(access_token_bearer),
+):
     jti = token_data["jti"]
     # Check if token is already revoked
     if await token_in_blocklist(jti):
         raise HTTPException(status_code=401, detail="Token already revoked")
-    # Add token to blocklist
-    await add_jti_blocklist(jti)
+    revoked = [(jti, token_data["exp"])]
+    if request and request.refresh_token:
+        refresh_data = decode_access_token(request.refresh_token)
+        if not refresh_data.get("refresh") or refresh_data.get("uid") != token_data.get("uid"):
+            raise HTTPException(status_code=401, detail="Invalid refresh token")
+        revoked.append((refresh_data["jti"], refresh_data["exp"]))
+    # Add the tokens to blocklist until they would have expired anyway, in one round trip
+    await add_jtis_blocklist(revoked)
     return {"detail": "Logout successful"}
+
+
+@router.get("/blocklist/stats", dependencies=[Depends(RoleChecker(["admin"]))])
+async def blocklist_stats():
+    return await revoked_tokens.stats()
@@ -3,13 +3,18 @@ from datetime import datetime
 from typing import Annotated
 
 import sqlalchemy.dialects.postgresql as pg
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
-from sqlmodel import Column, Field, SQLModel, select
+from sqlalchemy import event
+from sqlmodel import Column, Field, SQLModel
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from book_a1.auth import RoleChecker, access_token_bearer
 from book_a1.db import book_a1_meta, db
+from book_a1.search import create_search_column, search_statement
+from book_a1.suggest import Suggestion, book_suggestions
+from common.projection import FieldSet, Projection, json_response, projection
+from common.repository import Repository
 
 # 1. authorize JWT token => curl -X GET "http://localhost:8000/books" -H "Authorization: Bearer <JWT>" -H "accept: application/json"
 
@@ -29,13 +34,19 @@ class Book(SQLModel, table=True):
     published_date: str
     page_count: int
     language: str
-    created_at: datetime = Field(default_factory=datetime.now)
+    created_at: datetime = Field(default_factory=datetime.now, index=True)
     update_at: datetime = Field(default_factory=datetime.now)
 
     def __repr__(self) -> str:
         return f"book-(uid={self.uid}, title={self.title}, author={self.author})"
 
 
+event.listen(Book.__table__, "after_create", create_search_column)
+
+
+book_rows = projection(Book)
+
+
 class BookCreateModel(BaseModel):
     title: str
     author: str
@@ -52,54 +63,85 @@ class BookUpdateModel(BaseModel):
     page_count: int
     language: str
 
-# * 2. services
+class BookSearchResult(BaseModel):
+    book: Book
+    rank: float
 
+class BookSearchPage(BaseModel):
+    items: list[BookSearchResult]
+    next_offset: int | None
 
-class BookService:
-    def __init__(self, session: AsyncSession):
-        self.session = session
+# * 2. services
 
-    async def save(self, book: Book):
-        self.session.add(book)
-        await self.session.commit()
-        await self.session.refresh(book)
-        return book
+
+class BookService(Repository[Book]):
+    model = Book
 
     async def create_book(self, book_data: BookCreateModel):
         data_dict = book_data.model_dump(exclude_unset=True)
-        book = Book(**data_dict)
-        return await self.save(book)
+        book = await self.save(Book(**data_dict))
+        await book_suggestions.upsert([book])
+        return book
 
-    async def get_books(self):
-        result = await self.session.execute(select(Book).order_by(Book.created_at))
-        return result.scalars().all()
+    async def get_books(self, rows: Projection = book_rows) -> list:
+        # rows, not Book instances: nothing lands in the identity map
+        return await rows.all(self.session, rows.statement.order_by(Book.created_at))
+
+    async def create_books(self, books: list[BookCreateModel]):
+        items = await self.insert_many(book.model_dump() for book in books)
+        await book_suggestions.upsert(items)
+        return items
+
+    async def search_books(self, q: str, limit: int, offset: int) -> BookSearchPage:
+        statement = search_statement(Book, self.session.get_bind().dialect.name, q)
+        # one extra row tells whether there is a next page
+        result = await self.session.execute(statement.limit(limit + 1).offset(offset))
+        rows = result.all()
+        return BookSearchPage(
+            items=[BookSearchResult(book=book, rank=rank) for book, rank in rows[:limit]],
+            next_offset=offset + limit if len(rows) > limit else None,
+        )
 
     async def get_book(self, book_uid: str):
-        result = await self.session.execute(select(Book).where(Book.uid == book_uid))
-        result = result.scalar_one_or_none()
-        return result
+        return await self.get(book_uid)
+
+    async def get_book_row(self, book_uid: str, rows: Projection):
+        try:
+            uid = uuid.UUID(book_uid)
+        except ValueError:
+            raise HTTPException(status_code=404, detail="book not found")
+        found = await rows.all(self.session, rows.statement.where(Book.uid == uid))
+        if not found:
+            raise HTTPException(status_code=404, detail="book not found")
+        return found[0]
 
     async def update_book(self, book_uid: str, book_data: BookUpdateModel):
-        book_to_update = await self.get_book(book_uid)
-        if not book_to_update:
+        # UPDATE .. RETURNING: no load before and no refresh after the write
+        book = await self.update(book_uid, book_data.model_dump())
+        if not book:
             raise HTTPException(status_code=303, detail="book not found")
-        data_dict = book_data.model_dump()
-        for key, value in data_dict.items():
-            setattr(book_to_update, key, value)
-
-        return await self.save(book_to_update)
+        await book_suggestions.upsert([book])
+        return book
 
     async def delete_book(self, book_uid: str):
-        book_to_delete = await self.get_book(book_uid)
-        if not book_to_delete:
+        book = await self.delete(book_uid)
+        if not book:
             raise HTTPException(status_code=404, detail="book not found")
-        await self.session.delete(book_to_delete)
-        await self.session.commit()
-        return book_to_delete
+        await book_suggestions.delete(book.uid)
+        return book
+
+
+async def suggestion_rows(batch_size: int = 5000):
+    """(uid, title, author) batches for the autocomplete index."""
+    async with db.async_session() as session:
+        async for batch in BookService(session).iter_all(batch_size):
+            yield [(str(book.uid), book.title, book.author) for book in batch]
 
 router = APIRouter()
 session_dep = Annotated[AsyncSession, Depends(db)]
 user_dep = Annotated[dict, Depends(access_token_bearer)]
+# ?fields=title,author selects only those columns
+fields_dep = Annotated[Projection, Depends(FieldSet(Book))]
 
 @router.post(
     "/", status_code=201, response_model=Book, dependencies=[Depends(role_checker)]
@@ -108,15 +150,62 @@ async def create_book(book_data: BookCreateModel, session: session_dep, user: us
     service = BookService(session)
     return await service.create_book(book_data)
 
+@router.post(
+    "/bulk",
+    status_code=201,
+    response_model=list[Book],
+    dependencies=[Depends(role_checker)],
+)
+async def create_books(
+    books: list[BookCreateModel], session: session_dep, user: user_dep
+):
+    service = BookService(session)
+    return await service.create_books(books)
+
 @router.get(
     "/",
     status_code=200,
     response_model=list[Book],
     dependencies=[Depends(role_checker)],
 )
-async def get_books(session: session_dep, user: user_dep):
+async def get_books(session: session_dep, user: user_dep, fields: fields_dep):
     service = BookService(session=session)
-    return await service.get_books()
+    return json_response(await service.get_books(fields))
+
+# answered from the in-memory index, no database round trip
+@router.get(
+    "/suggest",
+    status_code=200,
+    response_model=list[Suggestion],
+    dependencies=[Depends(role_checker)],
+)
+async def suggest_books(
+    user: user_dep,
+    prefix: Annotated[str, Query(min_length=1, max_length=100)],
+    limit: Annotated[int, Query(ge=1, le=50)] = 10,
+):
+    return book_suggestions.search(prefix, limit)
+
+@router.get("/suggest/stats", dependencies=[Depends(role_checker)])
+async def suggest_stats(user: user_dep):
+    return book_suggestions.stats()
+
+# curl "http://localhost:8000/book_a1/books/search?q=tolkien&limit=20" -H "Authorization: Bearer <JWT>"
+@router.get(
+    "/search",
+    status_code=200,
+    response_model=BookSearchPage,
+    dependencies=[Depends(role_checker)],
+)
+async def search_books(
+    session: session_dep,
+    user: user_dep,
+    q: Annotated[str, Query(min_length=1, max_length=200, pattern=r"\S")],
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    offset: Annotated[int, Query(ge=0, le=10_000)] = 0,
+):
+    service = BookService(session=session)
+    return await service.search_books(q, limit, offset)
 
 @router.get(
     "/{book_uid}",
@@ -124,8 +213,12 @@ async def get_books(session: session_dep, user: user_dep):
     response_model=Book,
     dependencies=[Depends(role_checker)],
 )
-async def get_book(book_uid: str, session: session_dep, user: user_dep):
+async def get_book(
+    book_uid: str, session: session_dep, user: user_dep, fields: fields_dep
+):
     service = BookService(session=session)
+    if fields is not book_rows:
+        return json_response(await service.get_book_row(book_uid, fields))
     return await service.get_book(book_uid)
 
 
@@ -1,12 +1,19 @@
+import asyncio
+import itertools
 import logging
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from redis import asyncio as aioredis
-from sqlalchemy import MetaData
-from sqlalchemy.exc import OperationalError
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy import Engine, MetaData, text
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlmodel import Session
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from common.kv import Backend, kv_backend
+from common.revocation import RevocationStore
+from common.routing import RoutingMixin
+from common.schema import Schema
+
 logger = logging.getLogger(__name__)
 
 
@@ -20,6 +27,16 @@ class PostgresSettings(BaseSettings):
     JWT_ALGORITHM: str
     REDIS_HOST: str = "127.0.0.1"
     REDIS_PORT: int = 6379
+    REVOKED_FILTER_CAPACITY: int = 100_000
+    REVOKED_FILTER_ERROR_RATE: float = 0.001
+    # JSON list, e.g. REPLICA_URLS='["postgresql+asyncpg://..@replica1/db"]'
+    REPLICA_URLS: list[str] = []
+    REPLICA_MAX_LAG: float = 5.0
+    REPLICA_CHECK_INTERVAL: float = 5.0
+    # "memory": blocklist and suggestion events in-process, single worker only
+    KV_BACKEND: Backend = "redis"
+    # one file per app, the stores would overwrite each other's
+    BOOK_KV_SNAPSHOT_PATH: str | None = None
     # REDIS_DB : int = 0
 
 
@@ -27,39 +44,122 @@ settings = PostgresSettings()
 
 book_a1_meta = MetaData()
 
-JTI_EXPIRY = 30
-
-token_blocked_list = aioredis.Redis(
-    host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0, decode_responses=True
+token_blocked_list = kv_backend(
+    settings.KV_BACKEND,
+    settings.BOOK_KV_SNAPSHOT_PATH,
+    host=settings.REDIS_HOST,
+    port=settings.REDIS_PORT,
+    db=0,
+    decode_responses=True,
+)
+revoked_tokens = RevocationStore(
+    token_blocked_list,
+    namespace="book_a1:revoked",
+    filter_capacity=settings.REVOKED_FILTER_CAPACITY,
+    filter_error_rate=settings.REVOKED_FILTER_ERROR_RATE,
 )
 
 
-async def add_jti_blocklist(jti: str):
-    # await token_blocked_list.set(jti, JTI_EXPIRY, "true")
-    await token_blocked_list.set(name=jti, ex=JTI_EXPIRY, value="true")
+async def add_jti_blocklist(jti: str, exp: int):
+    await revoked_tokens.revoke(jti, exp)
+
+
+async def add_jtis_blocklist(tokens: list[tuple[str, int]]):
+    await revoked_tokens.revoke_many(tokens)
 
 
 async def token_in_blocklist(jti: str) -> bool:
-    jti = await token_blocked_list.get(name=jti)
-    return jti is not None
+    return await revoked_tokens.is_revoked(jti)
+
+
+# seconds the replica is behind, 0 when it has replayed everything it received
+REPLICA_LAG = {
+    "postgresql": """
+        SELECT CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END
+    """,
+}
+
+
+class RoutingSession(RoutingMixin, Session):
+    """Plain SELECTs go to a replica, everything else (and everything after
+    the first write) to the primary."""
 
 
 class Database:
-    def __init__(self, url: str):
-        self.async_engine = create_async_engine(settings.DATABASE_URL, echo=True)
+    def __init__(
+        self,
+        url: str,
+        replica_urls: list[str] = (),
+        max_lag: float = 5.0,
+        check_interval: float = 5.0,
+    ):
+        self.async_engine = create_async_engine(url, echo=True)
+        self.replicas = [create_async_engine(u, echo=True) for u in replica_urls]
+        self.healthy: list[AsyncEngine] = []
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._next = itertools.count()
+        self._monitor: asyncio.Task | None = None
+        self.schema = Schema("book_a1", self.async_engine, book_a1_meta)
         self.async_session = async_sessionmaker(
-            self.async_engine, expire_on_commit=False, class_=AsyncSession
+            expire_on_commit=False,
+            class_=AsyncSession,
+            sync_session_class=RoutingSession,
+            router=self,
         )
 
+    @property
+    def writer(self) -> Engine:
+        return self.async_engine.sync_engine
+
+    def reader(self) -> Engine:
+        return (self.replica() or self.async_engine).sync_engine
+
+    def replica(self) -> AsyncEngine | None:
+        """Next healthy replica, round-robin, None falls back to the primary."""
+        healthy = self.healthy
+        return healthy[next(self._next) % len(healthy)] if healthy else None
+
+    async def _lag(self, engine: AsyncEngine) -> float:
+        async with engine.connect() as conn:
+            query = REPLICA_LAG.get(engine.dialect.name, "SELECT 0")
+            return float((await conn.execute(text(query))).scalar() or 0)
+
+    async def check_replicas(self) -> None:
+        healthy = []
+        for engine in self.replicas:
+            try:
+                lag = await asyncio.wait_for(self._lag(engine), self.check_interval)
+            except (SQLAlchemyError, OSError, asyncio.TimeoutError) as e:
+                logger.warning("replica %s is down: %s", engine.url.render_as_string(), e)
+                continue
+            if lag > self.max_lag:
+                logger.warning("replica %s is %.1fs behind, skipped", engine.url.render_as_string(), lag)
+                continue
+            healthy.append(engine)
+        self.healthy = healthy
+
+    async def _watch_replicas(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.check_replicas()
+
     async def __call__(self):
         async with self.async_session() as session:
             yield session
 
     async def init(self):
         try:
-            async with self.async_engine.begin() as conn:
-                await conn.run_sync(book_a1_meta.create_all, checkfirst=True)
+            await self.schema.ensure()
             logger.info("✓ Database connected successfully")
+            if self.replicas:
+                await self.check_replicas()
+                self._monitor = asyncio.create_task(self._watch_replicas())
+                logger.info("✓ %d/%d replicas healthy", len(self.healthy), len(self.replicas))
         except (OperationalError, OSError, ConnectionRefusedError) as e:
             logger.error("✗ Failed to connect to PostgreSQL database")
             raise RuntimeError(
@@ -67,7 +167,17 @@ class Database:
             ) from e
 
     async def close(self):
+        if self._monitor is not None:
+            self._monitor.cancel()
+            self._monitor = None
+        for engine in self.replicas:
+            await engine.dispose()
         await self.async_engine.dispose()
 
 
-db = Database(settings.DATABASE_URL)
+db = Database(
+    settings.DATABASE_URL,
+    replica_urls=settings.REPLICA_URLS,
+    max_lag=settings.REPLICA_MAX_LAG,
+    check_interval=settings.REPLICA_CHECK_INTERVAL,
+)
@@ -0,0 +1,11 @@
+import logging
+
+from common.jobs import jobs
+
+logger = logging.getLogger(__name__)
+
+
+@jobs.job("book_a1.user_registered")
+async def user_registered(uid: str, email: str):
+    # verification mail and other onboarding for a committed user row
+    logger.info("user %s registered with %s", uid, email)
@@ -0,0 +1,112 @@
+from sqlalchemy import Select, column, event, func, literal_column, select, table, text
+
+from book_a1.db import book_a1_meta
+
+# Full-text search over title, author and publisher. Postgres keeps a stored
+# generated tsvector column with a GIN index. It is added together with a new
+# `books` table (empty, nothing to rewrite); an existing table gets it from the
+# Alembic migration, since adding it rewrites `books` under an ACCESS EXCLUSIVE
+# lock, not something to do at boot. SQLite (local runs) has an FTS5 table that
+# triggers keep in sync, created with raw DDL after the tables since it is not
+# part of the Book model.
+
+SEARCH_NAMES = {"search_vector", "ix_books_search", "books_fts"}
+
+_POSTGRES = [
+    """
+    ALTER TABLE books ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce(author, '')), 'B')
+        || setweight(to_tsvector('simple', coalesce(publisher, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_books_search ON books USING GIN (search_vector)",
+]
+
+_SQLITE = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+        title, author, publisher, content='books', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts(rowid, title, author, publisher)
+        VALUES (new.rowid, new.title, new.author, new.publisher);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author, publisher)
+        VALUES ('delete', old.rowid, old.title, old.author, old.publisher);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author, publisher)
+        VALUES ('delete', old.rowid, old.title, old.author, old.publisher);
+        INSERT INTO books_fts(rowid, title, author, publisher)
+        VALUES (new.rowid, new.title, new.author, new.publisher);
+    END
+    """,
+]
+# indexes the rows already in books; also needed after a VACUUM, which may
+# renumber the rowids (books has no INTEGER PRIMARY KEY)
+_SQLITE_REBUILD = "INSERT INTO books_fts(books_fts) VALUES ('rebuild')"
+
+
+def create_search_column(target, connection, **kw):
+    """after_create of the books table: only fires when the table is new."""
+    if connection.dialect.name == "postgresql":
+        for statement in _POSTGRES:
+            connection.execute(text(statement))
+
+
+@event.listens_for(book_a1_meta, "after_create")
+def create_search_index(target, connection, **kw):
+    if connection.dialect.name != "sqlite":
+        return
+    existed = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'")
+    ).first()
+    for statement in _SQLITE:
+        connection.execute(text(statement))
+    if not existed:
+        connection.execute(text(_SQLITE_REBUILD))
+
+
+def include_name(name, type_, parent_names) -> bool:
+    """Alembic filter, autogenerate should not drop the search objects."""
+    return name not in SEARCH_NAMES and not name.startswith("books_fts_")
+
+
+def fts5_query(q: str) -> str:
+    # every word quoted: user input can't inject FTS5 operators, words are ANDed
+    return " ".join('"' + word.replace('"', '""') + '"' for word in q.split())
+
+
+def search_statement(model, dialect: str, q: str) -> Select:
+    """SELECT model, rank matching q, best match first."""
+    if dialect == "postgresql":
+        vector = literal_column("books.search_vector")
+        query = func.websearch_to_tsquery("simple", q)
+        rank = func.ts_rank_cd(vector, query)
+        return (
+            select(model, rank.label("rank"))
+            .where(vector.op("@@")(query))
+            .order_by(rank.desc(), model.uid)
+        )
+    if dialect == "sqlite":
+        fts = table("books_fts", column("rowid"))
+        # bm25 is lower for better matches, columns weighted title > author > publisher
+        rank = -func.bm25(literal_column("books_fts"), 10.0, 5.0, 1.0)
+        return (
+            select(model, rank.label("rank"))
+            .select_from(fts)
+            .join(model, literal_column("books.rowid") == fts.c.rowid)
+            .where(literal_column("books_fts").op("MATCH")(fts5_query(q)))
+            .order_by(rank.desc(), model.uid)
+        )
+    raise NotImplementedError(f"book search is not supported on {dialect}")
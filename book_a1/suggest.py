@@ -0,0 +1,276 @@
+import asyncio
+import json
+import logging
+import sys
+import unicodedata
+import uuid
+from array import array
+from bisect import bisect_left, insort
+from collections.abc import AsyncIterator, Callable, Iterable, Iterator
+from itertools import islice
+
+from pydantic import BaseModel
+from redis.exceptions import RedisError
+
+from book_a1.db import token_blocked_list
+from common.kv import KeyValue
+
+logger = logging.getLogger(__name__)
+
+# Title/author autocomplete answered from memory, one index per worker.
+# The index is a sorted vocabulary of the words in titles and authors, each
+# with an array of the books (4-byte slots) it appears in. The last word of
+# the query is a prefix: one bisect into the vocabulary, then a walk over the
+# matching words. Earlier words must appear as whole words, so "lord of th"
+# finds "The Lord of the Rings".
+#
+# Removing a book only clears its slot: its postings stay behind as
+# tombstones that lookups skip, and the index is rebuilt from the live books
+# once there are more tombstones than books (and at least COMPACT_AFTER).
+#
+# Each worker applies its own writes right away and publishes them, the
+# others apply them from pub/sub. The index is rebuilt from the database on
+# start and whenever pub/sub reconnects.
+
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 30.0
+COMPACT_AFTER = 1024
+SMALL_POSTING = 2048
+# bounds the work of one lookup when the words hardly ever appear together
+MAX_SCAN = 20_000
+
+
+def normalize(text: str) -> str:
+    # accents dropped, punctuation splits words: "Émile: Tome-1" -> "emile tome 1"
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(c if c.isalnum() else " " for c in text if not unicodedata.combining(c))
+    return " ".join(text.split())
+
+
+def words(title: str, author: str) -> set[str]:
+    return set(normalize(f"{title} {author}").split())
+
+
+class Suggestion(BaseModel):
+    uid: uuid.UUID
+    title: str
+    author: str
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._words: list[str] = []
+        self._postings: dict[str, array] = {}
+        self._books: list[tuple[str, str, str] | None] = []
+        self._slots: dict[str, int] = {}
+        self._dead = 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def load(self, books: Iterable[tuple[str, str, str]]) -> None:
+        """Replace the content with (uid, title, author) rows, sorting once."""
+        postings: dict[str, list[int]] = {}
+        self._books, self._slots, self._dead = [], {}, 0
+        for uid, title, author in books:
+            slot = len(self._books)
+            self._books.append((uid, title, sys.intern(author)))
+            self._slots[uid] = slot
+            for word in words(title, author):
+                postings.setdefault(sys.intern(word), []).append(slot)
+        self._postings = {word: array("I", slots) for word, slots in postings.items()}
+        self._words = sorted(self._postings)
+
+    def add(self, uid: str, title: str, author: str) -> None:
+        self.remove(uid)
+        # slots are not reused, tombstoned postings may still point at them
+        slot = len(self._books)
+        self._books.append((uid, title, sys.intern(author)))
+        self._slots[uid] = slot
+        for word in words(title, author):
+            if word not in self._postings:
+                self._postings[word] = array("I")
+                insort(self._words, word)
+            self._postings[word].append(slot)
+
+    def remove(self, uid: str) -> None:
+        slot = self._slots.pop(uid, None)
+        if slot is None:
+            return
+        self._books[slot] = None
+        self._dead += 1
+        if self._dead >= COMPACT_AFTER and self._dead > len(self._slots):
+            self.compact()
+
+    def compact(self) -> None:
+        """Rebuild from the live books, dropping tombstones and unused words."""
+        self.load([book for book in self._books if book is not None])
+
+    def _completions(self, prefix: str) -> Iterator[str]:
+        for i in range(bisect_left(self._words, prefix), len(self._words)):
+            if not self._words[i].startswith(prefix):
+                return
+            yield self._words[i]
+
+    def _match(self, slot: int, complete: list[str], last: str) -> bool:
+        _, title, author = self._books[slot]
+        book_words = words(title, author)
+        return all(w in book_words for w in complete) and any(
+            w.startswith(last) for w in book_words
+        )
+
+    def search(self, prefix: str, limit: int = 10) -> list[Suggestion]:
+        terms = normalize(prefix).split()
+        if not terms:
+            return []
+        *complete, last = terms
+        # walk the shortest list of books: the rarest complete word if it is
+        # rare enough, otherwise the completions of the last word
+        rarest = min(complete, key=lambda w: len(self._postings.get(w, ())), default=None)
+        if rarest is not None and len(self._postings.get(rarest, ())) <= SMALL_POSTING:
+            slots = iter(self._postings.get(rarest, ()))
+        else:
+            slots = (slot for word in self._completions(last) for slot in self._postings[word])
+        found: dict[int, None] = {}
+        for slot in islice(slots, MAX_SCAN):
+            if slot in found or self._books[slot] is None:
+                continue
+            if not complete or self._match(slot, complete, last):
+                found[slot] = None
+                if len(found) == limit:
+                    break
+        return self._suggestions(found)
+
+    def _suggestions(self, slots: Iterable[int]) -> list[Suggestion]:
+        return [
+            Suggestion(uid=uid, title=title, author=author)
+            for uid, title, author in (self._books[slot] for slot in slots)
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "books": len(self._slots),
+            "words": len(self._words),
+            "tombstones": self._dead,
+            "memory_bytes": self.memory_bytes(),
+        }
+
+    def memory_bytes(self) -> int:
+        containers = (self._words, self._postings, self._books, self._slots)
+        size = sum(sys.getsizeof(c) for c in containers)
+        size += sum(sys.getsizeof(slots) for slots in self._postings.values())
+        seen = set()
+        for book in self._books:
+            if book is None:
+                continue
+            size += sys.getsizeof(book)
+            for text in book:
+                if id(text) not in seen:
+                    seen.add(id(text))
+                    size += sys.getsizeof(text)
+        return size + sum(sys.getsizeof(w) for w in self._words if id(w) not in seen)
+
+
+Loader = Callable[[], AsyncIterator[list[tuple[str, str, str]]]]
+
+
+class BookSuggestions:
+    def __init__(self, redis: KeyValue, channel: str):
+        self.redis = redis
+        self.channel = channel
+        self.index = PrefixIndex()
+        self.ready = False
+        self._origin = uuid.uuid4().hex
+        self._listener: asyncio.Task | None = None
+        self._pending: list[dict] | None = None
+
+    def _apply(self, event: dict) -> None:
+        if self._pending is not None:
+            self._pending.append(event)
+        if event["op"] == "delete":
+            self.index.remove(event["uid"])
+        else:
+            self.index.add(event["uid"], event["title"], event["author"])
+
+    async def _publish(self, events: list[dict]) -> None:
+        for event in events:
+            self._apply(event)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for event in events:
+                    pipe.publish(self.channel, json.dumps({**event, "origin": self._origin}))
+                await pipe.execute()
+        except RedisError as e:
+            logger.warning("book suggestions: publish failed: %s", e)
+
+    async def upsert(self, books: Iterable) -> None:
+        await self._publish(
+            [{"op": "upsert", "uid": str(b.uid), "title": b.title, "author": b.author} for b in books]
+        )
+
+    async def delete(self, uid) -> None:
+        await self._publish([{"op": "delete", "uid": str(uid)}])
+
+    def search(self, prefix: str, limit: int = 10) -> list[Suggestion]:
+        return self.index.search(prefix, limit)
+
+    async def start(self, load: Loader) -> None:
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen(load))
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def _rebuild(self, load: Loader) -> None:
+        # the scan may or may not see writes committed while it runs, those are
+        # collected and applied again, in order, on top of the fresh index
+        self._pending = []
+        try:
+            rows = []
+            async for batch in load():
+                rows.extend(batch)
+            fresh = PrefixIndex()
+            fresh.load(rows)
+            pending, self._pending = self._pending, None
+            self.index = fresh
+            for event in pending:
+                self._apply(event)
+        finally:
+            self._pending = None
+        self.ready = True
+        logger.info("book suggestions: index loaded, %d books", len(self.index))
+
+    async def _listen(self, load: Loader) -> None:
+        delay = RETRY_DELAY
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                await self._rebuild(load)
+                delay = RETRY_DELAY
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    event = json.loads(message["data"])
+                    if event.pop("origin", None) != self._origin:
+                        self._apply(event)
+            except Exception as e:
+                # Redis or the database: keep answering from the current index,
+                # it is rebuilt on the next try
+                logger.warning("book suggestions: index not in sync, retry in %.0fs: %r", delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+            finally:
+                await pubsub.aclose()
+
+    def stats(self) -> dict:
+        return {"ready": self.ready, **self.index.stats()}
+
+
+book_suggestions = BookSuggestions(token_blocked_list, channel="book_a1:suggest")
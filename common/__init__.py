@@ -0,0 +1 @@
+# Shared building blocks used by more than one app
@@ -0,0 +1,203 @@
+"""Online data migrations: chunked, throttled, resumable.
+
+Call it from a migration inside an autocommit block. The block commits the
+migration's DDL first, so the backfill's own connection can see it:
+
+    from common.backfill import backfill, create_index_concurrently
+
+    def upgrade() -> None:
+        op.add_column("books", sa.Column("title_key", sa.String(), nullable=True), if_not_exists=True)
+        books = sa.table("books", sa.column("uid", pg.UUID()), sa.column("title"), sa.column("title_key"))
+        with op.get_context().autocommit_block():
+            backfill(
+                op.get_bind(),
+                "books.title_key",
+                books.c.uid,
+                lambda chunk: sa.update(books).where(chunk).values(title_key=sa.func.lower(books.c.title)),
+            )
+            create_index_concurrently(op.get_bind(), "ix_books_title_key", "books", ["title_key"])
+
+Rows are walked in key order. Each chunk is one short transaction on a
+separate connection, and that transaction also records the last key done. An
+interrupted run (Ctrl-C, deploy, error) picks up after that key when the
+migration runs again, so write the DDL before the block to be re-runnable
+(if_not_exists). Between chunks the runner sleeps to keep its share of
+database time under `load`. On Postgres it also waits while more than
+`max_active` queries are running.
+"""
+
+import logging
+import time
+from collections.abc import Callable, Sequence
+
+from pydantic import TypeAdapter
+from sqlalchemy import (
+    Boolean,
+    Column,
+    ColumnElement,
+    Connection,
+    DateTime,
+    Executable,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    func,
+    insert,
+    select,
+    text,
+    update,
+)
+
+logger = logging.getLogger("backfill")
+
+# the runner's bookkeeping, outside of the apps' metadata (see migrations/env.py)
+backfill_meta = MetaData()
+checkpoints = Table(
+    "backfill_checkpoint",
+    backfill_meta,
+    Column("name", String, primary_key=True),
+    Column("last_key", String, nullable=True),
+    Column("rows", Integer, nullable=False, default=0),
+    Column("done", Boolean, nullable=False, default=False),
+    Column("updated_at", DateTime, nullable=False, default=func.now(), onupdate=func.now()),
+)
+
+MIN_CHUNK = 10
+MAX_CHUNK = 50_000
+LOG_EVERY = 5.0
+ACTIVE_QUERIES = text(
+    "SELECT count(*) FROM pg_stat_activity WHERE state = 'active' AND pid <> pg_backend_pid()"
+)
+
+
+def _checkpoint(connection: Connection, name: str):
+    with connection.begin():
+        checkpoints.create(connection, checkfirst=True)
+        row = connection.execute(select(checkpoints).where(checkpoints.c.name == name)).first()
+        if row is None:
+            connection.execute(insert(checkpoints).values(name=name, rows=0, done=False))
+            row = connection.execute(select(checkpoints).where(checkpoints.c.name == name)).first()
+    return row
+
+
+def _wait_for_capacity(connection: Connection, max_active: int | None, pause: float) -> None:
+    if max_active is None or connection.dialect.name != "postgresql":
+        return
+    while True:
+        with connection.begin():
+            active = connection.execute(ACTIVE_QUERIES).scalar()
+        if active <= max_active:
+            return
+        logger.info("backfill: %d active queries, waiting", active)
+        time.sleep(pause)
+
+
+def backfill(
+    connection: Connection,
+    name: str,
+    key: ColumnElement,
+    statement: Callable[[ColumnElement[bool]], Executable],
+    *,
+    where: ColumnElement[bool] | None = None,
+    chunk_size: int = 1000,
+    chunk_seconds: float = 0.5,
+    load: float = 0.5,
+    max_active: int | None = None,
+) -> int:
+    """Run `statement(chunk)` over the table of `key`, one chunk at a time.
+
+    `key` must be unique and indexed (the primary key), `chunk` is the range
+    condition of the current chunk on it and `where` limits the rows walked.
+    The chunk size adapts so that a chunk takes about `chunk_seconds`.
+    Returns the number of rows the statements reported as changed.
+    """
+    # the checkpoint keeps the key as text: ISO dates, canonical UUIDs, plain
+    # numbers, and parses it back to what the column compares against
+    as_key = TypeAdapter(key.type.python_type)
+    with connection.engine.connect() as own:
+        state = _checkpoint(own, name)
+        if state.done:
+            logger.info("backfill %s: already done, %d rows", name, state.rows)
+            return 0
+        last = None if state.last_key is None else as_key.validate_python(state.last_key)
+        done = state.rows
+        changed = 0
+        started = logged = time.perf_counter()
+        while True:
+            _wait_for_capacity(own, max_active, chunk_seconds)
+            chunk_started = time.perf_counter()
+            with own.begin():
+                keys = select(key.label("key")).order_by(key).limit(chunk_size)
+                if last is not None:
+                    keys = keys.where(key > last)
+                if where is not None:
+                    keys = keys.where(where)
+                upper = own.execute(select(func.max(keys.subquery().c.key))).scalar()
+                if upper is None:
+                    own.execute(
+                        update(checkpoints).where(checkpoints.c.name == name).values(done=True)
+                    )
+                    break
+                chunk = key <= upper if last is None else (key > last) & (key <= upper)
+                if where is not None:
+                    chunk = chunk & where
+                count = own.execute(statement(chunk)).rowcount
+                changed += max(count, 0)
+                done += max(count, 0)
+                own.execute(
+                    update(checkpoints)
+                    .where(checkpoints.c.name == name)
+                    .values(last_key=str(as_key.dump_python(upper, mode="json")), rows=done)
+                )
+            last = upper
+            elapsed = time.perf_counter() - chunk_started
+            # steer the chunk size towards chunk_seconds, at most x2 per step
+            scale = min(max(chunk_seconds / max(elapsed, 1e-3), 0.5), 2.0)
+            chunk_size = int(min(max(chunk_size * scale, MIN_CHUNK), MAX_CHUNK))
+            if time.perf_counter() - logged >= LOG_EVERY:
+                logged = time.perf_counter()
+                logger.info(
+                    "backfill %s: %d rows, %.0f rows/s, chunk %d",
+                    name, done, changed / (logged - started), chunk_size,
+                )
+            # busy for `elapsed`, idle long enough to stay at `load`
+            time.sleep(elapsed * (1 - load) / load)
+    logger.info("backfill %s: done, %d rows in %.1fs", name, done, time.perf_counter() - started)
+    return changed
+
+
+def forget(connection: Connection, name: str) -> None:
+    """Drop the checkpoint of `name`, for downgrades: the next run starts over."""
+    with connection.engine.connect() as own, own.begin():
+        checkpoints.create(own, checkfirst=True)
+        own.execute(checkpoints.delete().where(checkpoints.c.name == name))
+
+
+def create_index_concurrently(
+    connection: Connection, name: str, table: str, columns: Sequence[str], unique: bool = False
+) -> None:
+    """CREATE INDEX without blocking writes on Postgres, a plain one elsewhere.
+
+    Postgres refuses CONCURRENTLY inside a transaction, run it in an
+    autocommit block. A build that failed half-way leaves an invalid index
+    behind, that one is dropped and built again.
+    """
+    if connection.dialect.name == "postgresql":
+        invalid = connection.execute(
+            text(
+                "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid"
+                " WHERE c.relname = :name AND NOT i.indisvalid"
+            ),
+            {"name": name},
+        ).first()
+        if invalid:
+            connection.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+    reflected = Table(table, MetaData(), autoload_with=connection)
+    Index(
+        name,
+        *(reflected.c[column] for column in columns),
+        unique=unique,
+        postgresql_concurrently=True,
+    ).create(connection, checkfirst=True)
@@ -0,0 +1,30 @@
+import json
+
+from sqlalchemy import Select, bindparam, func, select, text
+from sqlalchemy.dialects import postgresql
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+_named_pg = postgresql.dialect(paramstyle="named")
+
+
+async def estimate_count(session: AsyncSession, statement: Select) -> int:
+    """Row count of `statement`, from the planner on Postgres.
+
+    The planner estimate costs one EXPLAIN instead of walking every matching
+    row; other databases (local SQLite) get an exact count.
+    """
+    if session.get_bind().dialect.name != "postgresql":
+        result = await session.execute(
+            select(func.count()).select_from(statement.order_by(None).subquery())
+        )
+        return result.scalar_one()
+    compiled = statement.order_by(None).compile(dialect=_named_pg)
+    explain = text(f"EXPLAIN (FORMAT JSON) {compiled}").bindparams(
+        *(
+            bindparam(name, compiled.params[name], type_=bind.type)
+            for bind, name in compiled.bind_names.items()
+        )
+    )
+    plan = (await session.execute(explain)).scalar_one()
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    return int(plan[0]["Plan"]["Plan Rows"])
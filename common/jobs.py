@@ -0,0 +1,239 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import time
+from typing import Awaitable, Callable
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from redis.asyncio import Redis
+from redis.exceptions import RedisError, ResponseError
+
+logger = logging.getLogger(__name__)
+
+# Background jobs on a Redis stream with one consumer group.
+# Web handlers only XADD after their own commit; `python worker.py` runs the
+# handlers. A failed job is acked and parked in a sorted set until its backoff
+# is over, then moved back onto the stream; after MAX_ATTEMPTS it goes to the
+# dead-letter stream. Jobs of a worker that died stay pending and are claimed
+# by another worker after VISIBILITY_TIMEOUT; a worker renews the lease of the
+# jobs it is running, and only reads as many as it has free slots, so a slow
+# handler is not started twice.
+
+
+class JobSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="JOBS_", extra="ignore")
+    REDIS_URL: str = "redis://127.0.0.1:6379/0"
+    STREAM: str = "jobs"
+    MAX_ATTEMPTS: int = 5
+    BACKOFF: float = 2.0
+    VISIBILITY_TIMEOUT: int = 60
+    MAXLEN: int = 1_000_000
+
+
+job_settings = JobSettings()
+
+Handler = Callable[..., Awaitable[None]]
+
+# moves due retries back onto the stream, atomic across workers
+_RELEASE_DUE = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 100)
+for _, member in ipairs(due) do
+    redis.call('ZREM', KEYS[1], member)
+    local job = cjson.decode(member)
+    redis.call('XADD', KEYS[2], '*', 'name', job.name, 'payload', job.payload, 'attempt', job.attempt)
+end
+return #due
+"""
+
+
+class JobQueue:
+    def __init__(
+        self,
+        redis: Redis,
+        stream: str,
+        max_attempts: int,
+        backoff: float,
+        visibility_timeout: int,
+        maxlen: int,
+    ):
+        self.redis = redis
+        self.stream = stream
+        self.group = f"{stream}:workers"
+        self.delayed = f"{stream}:delayed"
+        self.dead = f"{stream}:dead"
+        self.counters = f"{stream}:counters"
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.visibility_timeout = visibility_timeout
+        self.maxlen = maxlen
+        self.handlers: dict[str, Handler] = {}
+        self._release_due = redis.register_script(_RELEASE_DUE)
+
+    def job(self, name: str) -> Callable[[Handler], Handler]:
+        def register(handler: Handler) -> Handler:
+            self.handlers[name] = handler
+            return handler
+
+        return register
+
+    async def enqueue(self, name: str, **payload) -> str | None:
+        try:
+            return await self.redis.xadd(
+                self.stream,
+                {"name": name, "payload": json.dumps(payload, default=str), "attempt": 0},
+                maxlen=self.maxlen,
+                approximate=True,
+            )
+        except RedisError:
+            # the caller's write is committed already, keep enough to replay it by hand
+            logger.exception("job %s not enqueued, payload=%s", name, payload)
+            return None
+
+    # * worker
+
+    async def work(self, concurrency: int, consumer: str | None = None) -> None:
+        consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        running: dict[str, asyncio.Task] = {}
+        scheduler = asyncio.create_task(self._release_retries())
+        leases = asyncio.create_task(self._renew_leases(consumer, running))
+        logger.info("worker %s: %d slots, handlers: %s", consumer, concurrency, sorted(self.handlers))
+        next_claim = 0.0
+        claim_from = "0-0"
+        try:
+            while True:
+                free = concurrency - len(running)
+                if not free:
+                    await asyncio.wait(running.values(), return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                entries = []
+                if time.monotonic() >= next_claim:
+                    # jobs left pending by workers that died, `free` per pass;
+                    # the scan goes on from the returned cursor until it is back at 0-0
+                    claim_from, entries, *_ = await self.redis.xautoclaim(
+                        self.stream,
+                        self.group,
+                        consumer,
+                        min_idle_time=self.visibility_timeout * 1000,
+                        start_id=claim_from,
+                        count=free,
+                    )
+                    if claim_from in ("0-0", b"0-0"):
+                        claim_from = "0-0"
+                        next_claim = time.monotonic() + self.visibility_timeout / 2
+                if not entries and claim_from == "0-0":
+                    response = await self.redis.xreadgroup(
+                        self.group, consumer, {self.stream: ">"}, count=free, block=5000
+                    )
+                    entries = response[0][1] if response else []
+                for entry_id, fields in entries:
+                    if entry_id in running:
+                        # its lease lapsed while it runs here, don't start it twice
+                        continue
+                    task = asyncio.create_task(self._run(entry_id, fields))
+                    running[entry_id] = task
+                    task.add_done_callback(lambda _, entry_id=entry_id: running.pop(entry_id, None))
+        finally:
+            scheduler.cancel()
+            leases.cancel()
+            for task in list(running.values()):
+                task.cancel()
+
+    async def _renew_leases(self, consumer: str, running: dict[str, asyncio.Task]) -> None:
+        # claiming a pending entry again resets its idle time, so xautoclaim in
+        # other workers keeps off the jobs still running here
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            if not running:
+                continue
+            try:
+                await self.redis.xclaim(
+                    self.stream, self.group, consumer, 0, list(running), justid=True
+                )
+            except RedisError as e:
+                logger.warning("renewing job leases failed: %s", e)
+
+    async def _run(self, entry_id: str, fields: dict) -> None:
+        name = fields["name"]
+        attempt = int(fields.get("attempt", 0))
+        started = time.perf_counter()
+        try:
+            handler = self.handlers[name]
+            await handler(**json.loads(fields["payload"]))
+        except Exception as e:
+            await self._failed(entry_id, fields, attempt, e)
+            return
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xack(self.stream, self.group, entry_id)
+            pipe.xdel(self.stream, entry_id)
+            pipe.hincrby(self.counters, "processed", 1)
+            pipe.hincrbyfloat(self.counters, "seconds", time.perf_counter() - started)
+            await pipe.execute()
+
+    async def _failed(self, entry_id: str, fields: dict, attempt: int, error: Exception) -> None:
+        retry = fields["name"] in self.handlers and attempt + 1 < self.max_attempts
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if retry:
+                delay = self.backoff**attempt * random.uniform(0.8, 1.2)
+                member = json.dumps({**fields, "attempt": attempt + 1, "id": entry_id})
+                pipe.zadd(self.delayed, {member: time.time() + delay})
+                pipe.hincrby(self.counters, "retried", 1)
+                logger.warning("job %s %s failed (%r), retry in %.1fs", fields["name"], entry_id, error, delay)
+            else:
+                pipe.xadd(self.dead, {**fields, "id": entry_id, "error": repr(error)})
+                pipe.hincrby(self.counters, "dead", 1)
+                logger.error("job %s %s dead-lettered: %r", fields["name"], entry_id, error)
+            pipe.xack(self.stream, self.group, entry_id)
+            pipe.xdel(self.stream, entry_id)
+            await pipe.execute()
+
+    async def _release_retries(self) -> None:
+        while True:
+            try:
+                await self._release_due(keys=[self.delayed, self.stream], args=[time.time()])
+            except RedisError as e:
+                logger.warning("releasing job retries failed: %s", e)
+            await asyncio.sleep(0.5)
+
+    async def metrics(self) -> dict:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.xlen(self.stream)
+            pipe.zcard(self.delayed)
+            pipe.xlen(self.dead)
+            pipe.hgetall(self.counters)
+            length, delayed, dead, counters = await pipe.execute()
+        try:
+            groups = await self.redis.xinfo_groups(self.stream)
+        except ResponseError:
+            groups = []
+        group = next((g for g in groups if g["name"] == self.group), {})
+        processed = int(counters.get("processed", 0))
+        seconds = float(counters.get("seconds", 0))
+        return {
+            "stream_length": length,
+            "pending": group.get("pending", 0),
+            "lag": group.get("lag"),
+            "delayed": delayed,
+            "dead_letters": dead,
+            "processed": processed,
+            "retried": int(counters.get("retried", 0)),
+            "dead": int(counters.get("dead", 0)),
+            "avg_seconds": seconds / processed if processed else None,
+        }
+
+
+jobs = JobQueue(
+    Redis.from_url(job_settings.REDIS_URL, decode_responses=True),
+    stream=job_settings.STREAM,
+    max_attempts=job_settings.MAX_ATTEMPTS,
+    backoff=job_settings.BACKOFF,
+    visibility_timeout=job_settings.VISIBILITY_TIMEOUT,
+    maxlen=job_settings.MAXLEN,
+)
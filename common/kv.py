@@ -0,0 +1,302 @@
+import asyncio
+import heapq
+import json
+import logging
+import os
+import sys
+import time
+from collections.abc import AsyncIterator
+from fnmatch import fnmatchcase
+from typing import Any, Literal, Protocol
+
+from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+# The key-value calls the token blocklists (common.revocation) and the book
+# suggestions make: expiring hash fields, key scans and pub/sub. Two backends
+# provide them, redis.asyncio.Redis and MemoryStore below; which one an app
+# gets comes from its settings (KV_BACKEND).
+#
+# MemoryStore keeps everything in the worker process. It saves the network
+# hop on every authenticated request, but nothing is shared: use it for a
+# single-node deployment running one worker process.
+
+Backend = Literal["redis", "memory"]
+SNAPSHOT_INTERVAL = 60.0
+# expired entries removed per call at most, the rest on the next calls
+SWEEP_BATCH = 100
+
+
+class KeyValue(Protocol):
+    def pipeline(self, transaction: bool = True) -> Any: ...
+    async def hexists(self, name: str, key: str) -> bool: ...
+    async def hkeys(self, name: str) -> list: ...
+    async def hlen(self, name: str) -> int: ...
+    def scan_iter(self, match: str | None = None, count: int | None = None) -> AsyncIterator: ...
+    async def publish(self, channel: str, message: str) -> int: ...
+    def pubsub(self) -> Any: ...
+    async def memory_usage(self, key: str) -> int | None: ...
+    async def aclose(self) -> None: ...
+
+
+def _bytes(value) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode()
+
+
+def _text(value) -> str:
+    # key names come back from scan_iter as bytes without decode_responses
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class MemoryPubSub:
+    def __init__(self, store: "MemoryStore"):
+        self.store = store
+        self.channels: set[str] = set()
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    async def subscribe(self, *channels: str) -> None:
+        for channel in channels:
+            self.store._subscribers.setdefault(channel, set()).add(self.queue)
+            self.channels.add(channel)
+            self.queue.put_nowait(
+                {"type": "subscribe", "channel": channel, "data": len(self.channels)}
+            )
+
+    async def listen(self) -> AsyncIterator[dict]:
+        while self.channels:
+            yield await self.queue.get()
+
+    async def aclose(self) -> None:
+        for channel in self.channels:
+            self.store._subscribers.get(channel, set()).discard(self.queue)
+        self.channels.clear()
+
+
+class MemoryPipeline:
+    """Queues calls and runs them on execute, like a non-transactional pipeline."""
+
+    def __init__(self, store: "MemoryStore"):
+        self.store = store
+        self.calls: list[tuple[str, tuple]] = []
+
+    def __getattr__(self, name: str):
+        def queue(*args):
+            self.calls.append((name, args))
+            return self
+
+        return queue
+
+    async def execute(self) -> list:
+        calls, self.calls = self.calls, []
+        return [await getattr(self.store, name)(*args) for name, args in calls]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.calls = []
+
+
+class MemoryStore:
+    """The KeyValue calls served from a dict, for one process.
+
+    Hash fields expire at their HEXPIREAT time: an expired field is never
+    returned, and every call first drops up to SWEEP_BATCH due entries from a
+    heap ordered by expiry. With `snapshot_path` the live data is written to
+    a JSON file at most every `snapshot_interval` seconds after a change and
+    on aclose(), and read back on start.
+    """
+
+    def __init__(
+        self,
+        snapshot_path: str | None = None,
+        decode_responses: bool = False,
+        snapshot_interval: float = SNAPSHOT_INTERVAL,
+    ):
+        self.decode_responses = decode_responses
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._hashes: dict[str, dict[bytes, bytes]] = {}
+        self._expiry: dict[tuple[str, bytes], float] = {}
+        self._heap: list[tuple[float, str, bytes]] = []
+        self._subscribers: dict[str, set[asyncio.Queue]] = {}
+        self._dirty = False
+        self._saved = time.monotonic()
+        if snapshot_path and os.path.exists(snapshot_path):
+            self._load()
+
+    # * expiry
+
+    def _expired(self, name: str, field: bytes, now: float) -> bool:
+        at = self._expiry.get((name, field))
+        return at is not None and at <= now
+
+    def _drop(self, name: str, field: bytes) -> None:
+        fields = self._hashes.get(name)
+        if fields is not None:
+            fields.pop(field, None)
+            if not fields:
+                del self._hashes[name]
+        self._expiry.pop((name, field), None)
+
+    def _sweep(self) -> float:
+        now = time.time()
+        heap = self._heap
+        for _ in range(SWEEP_BATCH):
+            if not heap or heap[0][0] > now:
+                break
+            at, name, field = heapq.heappop(heap)
+            # the heap keeps stale entries when an expiry was moved
+            if self._expiry.get((name, field)) == at:
+                self._drop(name, field)
+        return now
+
+    def _decode(self, value: bytes):
+        return value.decode() if self.decode_responses else value
+
+    def _changed(self) -> None:
+        self._dirty = True
+        if self.snapshot_path and time.monotonic() - self._saved >= self.snapshot_interval:
+            self.save()
+
+    # * hashes
+
+    async def hset(self, name: str, key, value) -> int:
+        name = _text(name)
+        self._sweep()
+        fields = self._hashes.setdefault(name, {})
+        field = _bytes(key)
+        added = field not in fields
+        fields[field] = _bytes(value)
+        # HSET on an existing field keeps its TTL, a new field has none
+        if added:
+            self._expiry.pop((name, field), None)
+        self._changed()
+        return int(added)
+
+    async def hexpireat(self, name: str, when: int | float, *keys) -> list[int]:
+        name = _text(name)
+        now = self._sweep()
+        result = []
+        for key in keys:
+            field = _bytes(key)
+            if field not in self._hashes.get(name, {}):
+                result.append(-2)
+            elif when <= now:
+                self._drop(name, field)
+                result.append(2)
+            else:
+                self._expiry[(name, field)] = when
+                heapq.heappush(self._heap, (when, name, field))
+                result.append(1)
+        self._changed()
+        return result
+
+    async def hget(self, name: str, key):
+        name = _text(name)
+        now = self._sweep()
+        field = _bytes(key)
+        value = self._hashes.get(name, {}).get(field)
+        if value is None or self._expired(name, field, now):
+            return None
+        return self._decode(value)
+
+    async def hexists(self, name: str, key) -> bool:
+        name = _text(name)
+        now = self._sweep()
+        field = _bytes(key)
+        return field in self._hashes.get(name, {}) and not self._expired(name, field, now)
+
+    async def hkeys(self, name: str) -> list:
+        name = _text(name)
+        now = self._sweep()
+        return [
+            self._decode(field)
+            for field in self._hashes.get(name, {})
+            if not self._expired(name, field, now)
+        ]
+
+    async def hlen(self, name: str) -> int:
+        return len(await self.hkeys(name))
+
+    async def scan_iter(
+        self, match: str | None = None, count: int | None = None
+    ) -> AsyncIterator[str | bytes]:
+        self._sweep()
+        for name in list(self._hashes):
+            if match is None or fnmatchcase(name, match):
+                yield name if self.decode_responses else name.encode()
+
+    async def memory_usage(self, key) -> int | None:
+        fields = self._hashes.get(_text(key))
+        if fields is None:
+            return None
+        return sys.getsizeof(fields) + sum(
+            sys.getsizeof(f) + sys.getsizeof(v) for f, v in fields.items()
+        )
+
+    # * pub/sub
+
+    async def publish(self, channel: str, message) -> int:
+        queues = self._subscribers.get(channel, ())
+        data = self._decode(_bytes(message))
+        for queue in queues:
+            queue.put_nowait({"type": "message", "channel": channel, "data": data})
+        return len(queues)
+
+    def pubsub(self) -> MemoryPubSub:
+        return MemoryPubSub(self)
+
+    def pipeline(self, transaction: bool = True) -> MemoryPipeline:
+        return MemoryPipeline(self)
+
+    # * snapshot
+
+    def _load(self) -> None:
+        with open(self.snapshot_path) as file:
+            data = json.load(file)
+        now = time.time()
+        for name, fields in data.items():
+            for field, (value, at) in fields.items():
+                if at is not None and at <= now:
+                    continue
+                field = field.encode()
+                self._hashes.setdefault(name, {})[field] = value.encode()
+                if at is not None:
+                    self._expiry[(name, field)] = at
+                    heapq.heappush(self._heap, (at, name, field))
+        logger.info("kv: %d keys loaded from %s", len(self._hashes), self.snapshot_path)
+
+    def save(self) -> None:
+        """Write the live data to snapshot_path, atomically."""
+        now = self._sweep()
+        data = {
+            name: {
+                field.decode(): [value.decode(), self._expiry.get((name, field))]
+                for field, value in fields.items()
+                if not self._expired(name, field, now)
+            }
+            for name, fields in self._hashes.items()
+        }
+        partial = f"{self.snapshot_path}.tmp"
+        with open(partial, "w") as file:
+            json.dump(data, file)
+        os.replace(partial, self.snapshot_path)
+        self._dirty = False
+        self._saved = time.monotonic()
+
+    async def aclose(self) -> None:
+        if self.snapshot_path and self._dirty:
+            self.save()
+
+
+def kv_backend(
+    backend: Backend, snapshot_path: str | None = None, **redis: Any
+) -> Redis | MemoryStore:
+    """The configured backend; `redis` are the Redis() connection arguments."""
+    if backend == "memory":
+        return MemoryStore(snapshot_path, decode_responses=redis.get("decode_responses", False))
+    return Redis(**redis)
@@ -0,0 +1,185 @@
+"""Structured logging that never blocks a request.
+
+Modules log the usual way, with the fields as `extra`:
+
+    logger = logging.getLogger(__name__)
+    logger.debug("token accepted", extra={"jti": token_data["jti"]})
+
+After start() the root logger has a single QueueHandler: the calling thread
+only puts the record on a queue, a QueueListener thread formats it and writes
+it to stderr. When the queue is full records are dropped and counted instead
+of waiting. Each record carries the context of the request it was logged in
+(request_id, method, path, set by the RequestContext middleware), and only
+LOG_DEBUG_SAMPLE of the DEBUG records are kept. Output is one JSON object per
+line, LOG_FORMAT=text writes plain lines for a terminal.
+"""
+
+import json
+import logging
+import queue
+import random
+import re
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Literal
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class LogSettings(BaseSettings):
+    model_config = SettingsConfigDict(extra="ignore")
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: Literal["json", "text"] = "json"
+    LOG_DEBUG_SAMPLE: float = 0.01
+    LOG_QUEUE_SIZE: int = 10_000
+
+
+settings = LogSettings()
+
+_context: ContextVar[dict] = ContextVar("log_context", default={})
+
+# a client's X-Request-ID is kept only when it looks like an id
+_REQUEST_ID = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+# attributes every LogRecord has, anything else came in through `extra`
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message",
+    "asctime",
+}
+
+
+def bind(**fields) -> None:
+    """Add fields to every record logged from the current request (or task)."""
+    _context.set({**_context.get(), **fields})
+
+
+def current() -> dict:
+    """The fields bound to the current request."""
+    return _context.get()
+
+
+def fields(record: logging.LogRecord) -> dict:
+    return {k: v for k, v in vars(record).items() if k not in _RECORD_FIELDS}
+
+
+class ContextFilter(logging.Filter):
+    """Copies the request context onto the record, in the calling thread."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in _context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class DebugSampler(logging.Filter):
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            **fields(record),
+        }
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        extra = " ".join(f"{k}={v}" for k, v in fields(record).items())
+        line = super().format(record)
+        return f"{line} {extra}" if extra else line
+
+
+class DroppingQueueHandler(QueueHandler):
+    """A QueueHandler that drops records on a full queue rather than block."""
+
+    def __init__(self, records: queue.Queue):
+        super().__init__(records)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_handler: DroppingQueueHandler | None = None
+_listener: QueueListener | None = None
+
+
+def start(stream=None) -> None:
+    """Route the root logger through the queue. Idempotent."""
+    global _handler, _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if settings.LOG_FORMAT == "json" else TextFormatter())
+    records: queue.Queue = queue.Queue(settings.LOG_QUEUE_SIZE)
+    _handler = DroppingQueueHandler(records)
+    _handler.addFilter(DebugSampler(settings.LOG_DEBUG_SAMPLE))
+    _handler.addFilter(ContextFilter())
+    _listener = QueueListener(records, output, respect_handler_level=True)
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(settings.LOG_LEVEL)
+    _listener.start()
+
+
+def stop() -> None:
+    """Write out what is queued and detach from the root logger."""
+    global _handler, _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    logging.getLogger().removeHandler(_handler)
+    if _handler.dropped:
+        sys.stderr.write(f"logs: {_handler.dropped} records dropped, queue full\n")
+    _handler = _listener = None
+
+
+class RequestContext:
+    """ASGI middleware: a request id (X-Request-ID, or a new one) for every
+    request, bound to its log records and returned in the response."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        request_id = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")
+        if not _REQUEST_ID.fullmatch(request_id):
+            request_id = uuid.uuid4().hex
+        token = _context.set(
+            {"request_id": request_id, "method": scope["method"], "path": scope["path"]}
+        )
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-request-id", request_id.encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _context.reset(token)
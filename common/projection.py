@@ -0,0 +1,99 @@
+"""Read paths that return rows, not ORM objects.
+
+Loading `select(Model)` builds an instance per row and registers it in the
+session's identity map, then the route's response_model validates it once
+more on the way out. For list endpoints that only read, a Projection selects
+the columns as plain rows on the session's connection and puts each one in a
+slotted dataclass, and json_response() encodes the list in one pass with
+pydantic-core. The JSON is the same as the response_model produces; keep the
+response_model on the route for the OpenAPI schema.
+
+FieldSet turns a `?fields=title,author` query parameter into the Projection
+of just those columns, so the SELECT, the row type and the payload all
+shrink. Projections are built once per model and field set.
+"""
+
+from collections.abc import Iterable, Sequence
+from dataclasses import make_dataclass
+from functools import lru_cache
+from typing import Annotated, Any
+
+from fastapi import HTTPException, Query, Response
+from pydantic_core import to_json
+from sqlalchemy import ColumnElement, Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+
+class Projection:
+    """Some columns of a table and the slotted row type they are read into."""
+
+    def __init__(self, name: str, columns: Iterable[ColumnElement], types: dict | None = None):
+        self.columns = tuple(columns)
+        self.fields = tuple(column.key for column in self.columns)
+        types = types or {}
+        self.row = make_dataclass(
+            name, [(field, types.get(field, Any)) for field in self.fields], slots=True
+        )
+        self.statement = select(*self.columns)
+
+    @classmethod
+    def of(cls, model, fields: Sequence[str] | None = None) -> "Projection":
+        """The columns of `model`'s table named in `fields`, all of them by default."""
+        columns = [c for c in model.__table__.columns if fields is None or c.key in fields]
+        # SQLModel models give their field types, plain declarative ones Any
+        types = {name: f.annotation for name, f in getattr(model, "model_fields", {}).items()}
+        suffix = "" if fields is None else "_" + "_".join(c.key for c in columns)
+        return cls(f"{model.__name__}Row{suffix}", columns, types)
+
+    def load(self, rows: Iterable[Sequence]) -> list:
+        row = self.row
+        return [row(*values) for values in rows]
+
+    async def all(self, session: AsyncSession, statement: Select | None = None) -> list:
+        """Rows of `statement` (the bare projection by default), around the ORM."""
+        connection = await session.connection()
+        return self.load(await connection.execute(self.statement if statement is None else statement))
+
+    def all_sync(self, session: Session, statement: Select | None = None) -> list:
+        connection = session.connection()
+        return self.load(connection.execute(self.statement if statement is None else statement))
+
+
+@lru_cache(maxsize=256)
+def projection(model, fields: tuple[str, ...] | None = None) -> Projection:
+    return Projection.of(model, fields)
+
+
+class FieldSet:
+    """Dependency: the `fields` query parameter as a Projection of `model`.
+
+    Names are checked against the table's columns (422 otherwise); without
+    the parameter every column is selected.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.columns = tuple(c.key for c in model.__table__.columns)
+
+    def __call__(
+        self,
+        fields: Annotated[
+            str | None, Query(description="comma separated columns to return, e.g. id,status")
+        ] = None,
+    ) -> Projection:
+        if fields is None:
+            return projection(self.model)
+        names = {name.strip() for name in fields.split(",")} - {""}
+        unknown = names.difference(self.columns)
+        if not names or unknown:
+            raise HTTPException(
+                status_code=422,
+                detail=f"unknown fields {sorted(unknown)}, choose from {list(self.columns)}",
+            )
+        # in column order, so "a,b" and "b,a" share one cached projection
+        return projection(self.model, tuple(c for c in self.columns if c in names))
+
+
+def json_response(items, status_code: int = 200) -> Response:
+    return Response(to_json(items), status_code=status_code, media_type="application/json")
@@ -0,0 +1,174 @@
+from collections.abc import AsyncIterator, Iterable, Sequence
+from contextlib import asynccontextmanager
+from typing import Any, ClassVar, Generic, TypeVar
+
+from sqlalchemy import bindparam, delete, insert, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import SQLModel
+
+Model = TypeVar("Model", bound=SQLModel)
+
+# statements are built once per model and reused, SQLAlchemy then finds the
+# compiled form in its cache without walking a freshly built statement
+_statements: dict[tuple, Any] = {}
+
+
+class Repository(Generic[Model]):
+    """Shared data access for services, subclasses set `model`.
+
+    Write methods only flush. The outermost `unit_of_work()` block commits,
+    so several writes (and several services on the same session) share one
+    transaction.
+    """
+
+    model: ClassVar[type[SQLModel]]
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    @classmethod
+    def _primary_key(cls):
+        return inspect(cls.model).primary_key[0]
+
+    @classmethod
+    def _statement(cls, name: str, *key):
+        cache_key = (cls.model, name, *key)
+        statement = _statements.get(cache_key)
+        if statement is None:
+            statement = _statements[cache_key] = getattr(cls, f"_build_{name}")(*key)
+        return statement
+
+    @classmethod
+    def _build_get(cls):
+        return select(cls.model).where(cls._primary_key() == bindparam("id"))
+
+    @classmethod
+    def _build_get_many(cls):
+        return select(cls.model).where(
+            cls._primary_key().in_(bindparam("ids", expanding=True))
+        )
+
+    @classmethod
+    def _build_delete(cls):
+        return (
+            delete(cls.model)
+            .where(cls._primary_key() == bindparam("id"))
+            .returning(cls.model)
+            .execution_options(synchronize_session=False, populate_existing=True)
+        )
+
+    @classmethod
+    def _build_insert_many(cls):
+        return insert(cls.model).returning(cls.model)
+
+    @classmethod
+    def _build_upsert_many(cls, dialect: str, keys: tuple[str, ...]):
+        dialects = {"postgresql": postgresql, "sqlite": sqlite}
+        if dialect not in dialects:
+            raise NotImplementedError(f"upsert is not supported on {dialect}")
+        statement = dialects[dialect].insert(cls.model)
+        columns = [
+            c.name
+            for c in cls.model.__table__.columns
+            if c.name not in keys and not c.primary_key
+        ]
+        return (
+            statement.on_conflict_do_update(
+                index_elements=list(keys),
+                set_={name: statement.excluded[name] for name in columns},
+            )
+            .returning(cls.model)
+            .execution_options(populate_existing=True)
+        )
+
+    @asynccontextmanager
+    async def unit_of_work(self) -> AsyncIterator[AsyncSession]:
+        info = self.session.info
+        if info.get("unit_of_work"):
+            yield self.session
+            return
+        info["unit_of_work"] = True
+        try:
+            yield self.session
+            await self.session.commit()
+        except BaseException:
+            await self.session.rollback()
+            raise
+        finally:
+            info.pop("unit_of_work", None)
+
+    def _values(self, item: Model | dict) -> dict:
+        if isinstance(item, dict):
+            item = self.model.model_validate(item)
+        values = item.model_dump()
+        # let the database generate missing primary keys
+        for column in inspect(self.model).primary_key:
+            if values.get(column.key) is None:
+                values.pop(column.key, None)
+        return values
+
+    async def get(self, id) -> Model | None:
+        result = await self.session.execute(self._statement("get"), {"id": id})
+        return result.scalar_one_or_none()
+
+    async def get_many(self, ids: Iterable) -> Sequence[Model]:
+        """Rows for the ids that exist, in a single IN query."""
+        ids = list(ids)
+        if not ids:
+            return []
+        result = await self.session.execute(self._statement("get_many"), {"ids": ids})
+        return result.scalars().all()
+
+    async def iter_all(self, batch_size: int = 1000) -> AsyncIterator[Sequence[Model]]:
+        """Stream the whole table in batches instead of loading it at once."""
+        statement = select(self.model).execution_options(yield_per=batch_size)
+        result = await self.session.stream_scalars(statement)
+        async for batch in result.partitions(batch_size):
+            yield batch
+
+    async def save(self, item: Model) -> Model:
+        async with self.unit_of_work():
+            self.session.add(item)
+            await self.session.flush()
+        return item
+
+    async def insert_many(self, items: Iterable[Model | dict]) -> Sequence[Model]:
+        """INSERT .. RETURNING in batches of executemany / multi-row VALUES."""
+        values = [self._values(item) for item in items]
+        if not values:
+            return []
+        async with self.unit_of_work():
+            result = await self.session.execute(self._statement("insert_many"), values)
+            return result.scalars().all()
+
+    async def upsert_many(
+        self, items: Iterable[Model | dict], keys: Sequence[str] | None = None
+    ) -> Sequence[Model]:
+        """INSERT .. ON CONFLICT (keys) DO UPDATE, keys default to the primary key."""
+        values = [self._values(item) for item in items]
+        if not values:
+            return []
+        keys = tuple(keys or (c.name for c in inspect(self.model).primary_key))
+        dialect = self.session.get_bind().dialect.name
+        async with self.unit_of_work():
+            result = await self.session.execute(
+                self._statement("upsert_many", dialect, keys), values
+            )
+            return result.scalars().all()
+
+    async def update(self, id, values: dict) -> Model | None:
+        async with self.unit_of_work():
+            result = await self.session.execute(
+                update(self.model)
+                .where(self._primary_key() == id)
+                .values(**values)
+                .returning(self.model)
+                .execution_options(synchronize_session=False, populate_existing=True)
+            )
+            return result.scalar_one_or_none()
+
+    async def delete(self, id) -> Model | None:
+        async with self.unit_of_work():
+            result = await self.session.execute(self._statement("delete"), {"id": id})
+            return result.scalar_one_or_none()
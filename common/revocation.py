@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import time
+import uuid
+import zlib
+from typing import Iterable
+
+from common.bloom import BloomFilter
+from common.kv import KeyValue
+
+logger = logging.getLogger(__name__)
+
+# Revoked JWT ids are only interesting until the token would have expired anyway,
+# so every entry carries its own TTL taken from the token's `exp` claim.
+# Entries are spread over many small hashes: small hashes stay listpack encoded
+# in Redis, which costs a fraction of one top-level key per token.
+# Field expiry (HEXPIREAT) needs Redis >= 7.4.
+#
+# Optionally every worker keeps a Bloom filter of revoked ids in front of Redis.
+# It is rebuilt from Redis on start and fed through pub/sub afterwards; a miss
+# in the filter answers "not revoked" without a round trip. Other workers pick
+# up a revocation as soon as its pub/sub message arrives. Until the filter is
+# loaded (or while pub/sub is down) every check goes to Redis.
+
+DEFAULT_BUCKETS = 1024
+RETRY_DELAY = 1.0
+# the least time between two filter rebuilds from Redis
+REBUILD_INTERVAL = 60.0
+
+
+def _text(value: bytes | str) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class RevocationStore:
+    def __init__(
+        self,
+        redis: KeyValue,
+        namespace: str,
+        buckets: int = DEFAULT_BUCKETS,
+        filter_capacity: int = 0,
+        filter_error_rate: float = 0.001,
+    ):
+        self.redis = redis
+        self.namespace = namespace
+        self.buckets = buckets
+        self.channel = f"{namespace}:events"
+        self.filter_capacity = filter_capacity
+        self.filter_error_rate = filter_error_rate
+        self._filter: BloomFilter | None = None
+        self._listener: asyncio.Task | None = None
+        self._rebuilt = 0.0
+
+    @staticmethod
+    def _field(jti: str) -> str:
+        # uuid4 jtis are stored without dashes, anything else as is
+        try:
+            return uuid.UUID(jti).hex
+        except ValueError:
+            return jti
+
+    def _bucket(self, field: str) -> str:
+        return f"{self.namespace}:{zlib.crc32(field.encode()) % self.buckets}"
+
+    async def revoke(self, jti: str, exp: int | float) -> bool:
+        return await self.revoke_many([(jti, exp)]) == 1
+
+    async def revoke_many(self, tokens: Iterable[tuple[str, int | float]]) -> int:
+        """Revoke (jti, exp) pairs in one round trip, returns how many were stored.
+
+        Tokens that are already expired are skipped, they can't be used anymore.
+        """
+        now = int(time.time())
+        fields = []
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for jti, exp in tokens:
+                exp = int(exp)
+                if exp <= now:
+                    continue
+                field = self._field(jti)
+                key = self._bucket(field)
+                pipe.hset(key, field, exp)
+                pipe.hexpireat(key, exp, field)
+                if self.filter_capacity:
+                    pipe.publish(self.channel, field)
+                fields.append(field)
+            if fields:
+                await pipe.execute()
+        if self._filter is not None:
+            # the listener adds them again from pub/sub, that one doesn't count
+            for field in fields:
+                self._filter.add(field)
+        return len(fields)
+
+    async def is_revoked(self, jti: str | None) -> bool:
+        if not jti:
+            return False
+        field = self._field(jti)
+        if self._filter is not None and field not in self._filter:
+            return False
+        return bool(await self.redis.hexists(self._bucket(field), field))
+
+    # * local filter
+
+    async def start(self) -> None:
+        if self.filter_capacity and self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        self._filter = None
+
+    async def _rebuild(self) -> None:
+        self._rebuilt = time.monotonic()
+        fresh = BloomFilter(self.filter_capacity, self.filter_error_rate)
+        async for key in self.redis.scan_iter(f"{self.namespace}:[0-9]*", 1000):
+            for field in await self.redis.hkeys(key):
+                fresh.add(_text(field))
+        if fresh.count > self.filter_capacity:
+            self._filter = None
+            logger.warning(
+                "%s: %d live revocations exceed the filter capacity of %d, filter disabled",
+                self.namespace,
+                fresh.count,
+                self.filter_capacity,
+            )
+            return
+        self._filter = fresh
+        logger.info("%s: revocation filter loaded, %d ids", self.namespace, fresh.count)
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                # subscribe before loading so nothing revoked meanwhile is missed
+                await pubsub.subscribe(self.channel)
+                await self._rebuild()
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    if self._filter is not None:
+                        self._filter.add(_text(message["data"]))
+                        if self._filter.count <= self.filter_capacity:
+                            continue
+                    # expired ids can't be removed from a Bloom filter, start over; an
+                    # overfull filter only answers "maybe" more often, so not too often
+                    if time.monotonic() - self._rebuilt >= REBUILD_INTERVAL:
+                        await self._rebuild()
+            except Exception as e:
+                # a stale filter would miss what other workers revoke from now on
+                self._filter = None
+                logger.warning("%s: revocation filter disabled: %r", self.namespace, e)
+                await asyncio.sleep(RETRY_DELAY)
+            finally:
+                await pubsub.aclose()
+
+    async def stats(self) -> dict:
+        keys = [key async for key in self.redis.scan_iter(f"{self.namespace}:[0-9]*", 1000)]
+        entries = memory = 0
+        if keys:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.hlen(key)
+                    pipe.memory_usage(key)
+                result = await pipe.execute()
+            entries = sum(result[0::2])
+            memory = sum(m or 0 for m in result[1::2])
+        return {
+            "namespace": self.namespace,
+            "buckets": len(keys),
+            "entries": entries,
+            "memory_bytes": memory,
+            "filter_bytes": self._filter.memory_bytes if self._filter else 0,
+        }
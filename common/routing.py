@@ -0,0 +1,33 @@
+from typing import Protocol
+
+from sqlalchemy import Engine, Select
+
+
+class Router(Protocol):
+    writer: Engine
+
+    def reader(self) -> Engine: ...
+
+
+class RoutingMixin:
+    """Session mixin: plain SELECTs go to `router.reader()`, everything else
+    to `router.writer`.
+
+    After the first write the session stays on the writer, so it reads its
+    own writes. One reader is picked per session.
+    """
+
+    def __init__(self, *args, router: Router, **kw):
+        super().__init__(*args, **kw)
+        self.router = router
+
+    def get_bind(self, mapper=None, clause=None, **kw) -> Engine:
+        if clause is None and not self._flushing:
+            return self.router.writer
+        if self._flushing or not isinstance(clause, Select) or clause._for_update_arg:
+            self.info["writer"] = True
+        if self.info.get("writer"):
+            return self.router.writer
+        if "reader" not in self.info:
+            self.info["reader"] = self.router.reader()
+        return self.info["reader"]
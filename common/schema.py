@@ -0,0 +1,213 @@
+"""Boot-time schema check.
+
+Every database keeps the fingerprint of the schema it was last brought up to
+in `schema_fingerprint`. At startup each app reads its row (one query) and
+compares it with the fingerprint of its models. When they match, no DDL is
+run and nothing is reflected. When they don't:
+
+- SCHEMA_MODE=dev creates what is missing, including nullable columns added to
+  existing tables, and records the new fingerprint (the Dockerfile and
+  `dev.sh app_run` set it for `fastapi dev`)
+- otherwise startup fails; bring the databases up to date with
+
+      uv run python -m common.schema      # or ./dev.sh schema
+
+  which creates missing tables and indexes only. A column added to a table
+  that already exists needs a migration, `alembic upgrade head` first;
+  until then the fingerprint is not recorded.
+"""
+
+import asyncio
+import hashlib
+import logging
+import sys
+from collections.abc import Callable
+from typing import Literal
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from sqlalchemy import (
+    Column,
+    Connection,
+    DateTime,
+    Dialect,
+    MetaData,
+    String,
+    Table,
+    delete,
+    func,
+    insert,
+    inspect,
+    select,
+)
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.schema import CreateColumn, CreateIndex, CreateTable
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaSettings(BaseSettings):
+    model_config = SettingsConfigDict(extra="ignore")
+    SCHEMA_MODE: Literal["check", "dev"] = "check"
+
+
+settings = SchemaSettings()
+
+fingerprints = Table(
+    "schema_fingerprint",
+    MetaData(),
+    Column("name", String, primary_key=True),
+    Column("fingerprint", String(64), nullable=False),
+    Column("updated_at", DateTime, nullable=False, default=func.now()),
+)
+
+# every Schema, for `python -m common.schema`
+registry: list["Schema"] = []
+
+
+def create_missing_indexes(connection: Connection, metadata: MetaData) -> None:
+    # create_all only emits indexes together with a new table, so indexes added
+    # to a model later never reach databases that already have the table
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def missing_columns(connection: Connection, metadata: MetaData, tables: set[str]) -> list[Column]:
+    """Model columns that the existing `tables` don't have in the database."""
+    inspector = inspect(connection)
+    missing = []
+    for table in metadata.sorted_tables:
+        if table.name in tables:
+            present = {c["name"] for c in inspector.get_columns(table.name, schema=table.schema)}
+            missing += [c for c in table.columns if c.name not in present]
+    return missing
+
+
+def add_column(connection: Connection, column: Column) -> None:
+    table = connection.dialect.identifier_preparer.format_table(column.table)
+    spec = CreateColumn(column).compile(dialect=connection.dialect)
+    connection.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {spec}")
+
+
+def fingerprint(metadata: MetaData, dialect: Dialect) -> str:
+    """sha256 of the DDL create_all would emit on this dialect."""
+    digest = hashlib.sha256()
+    for table in metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=dialect)).encode())
+        for index in sorted(table.indexes, key=lambda index: index.name or ""):
+            digest.update(str(CreateIndex(index).compile(dialect=dialect)).encode())
+    return digest.hexdigest()
+
+
+class Schema:
+    """The tables of `metadata` on `engine`, recorded under `name`.
+
+    `create` runs after the tables on every apply, for data the schema needs
+    (it has to be idempotent).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        engine: AsyncEngine,
+        metadata: MetaData,
+        create: Callable[[Connection], None] | None = None,
+    ):
+        self.name = name
+        self.engine = engine
+        self.metadata = metadata
+        self.create = create
+        self._fingerprint: str | None = None
+        registry.append(self)
+
+    @property
+    def fingerprint(self) -> str:
+        if self._fingerprint is None:
+            self._fingerprint = fingerprint(self.metadata, self.engine.dialect)
+        return self._fingerprint
+
+    async def stored(self) -> str | None:
+        async with self.engine.connect() as connection:
+            try:
+                result = await connection.execute(
+                    select(fingerprints.c.fingerprint).where(fingerprints.c.name == self.name)
+                )
+            except (OperationalError, ProgrammingError):
+                # no schema_fingerprint table yet
+                return None
+            return result.scalar()
+
+    async def ensure(self, dev: bool | None = None) -> bool:
+        """Bring the schema up in dev mode, check it otherwise. True if DDL ran."""
+        stored = await self.stored()
+        if stored == self.fingerprint:
+            return False
+        if dev is None:
+            dev = settings.SCHEMA_MODE == "dev"
+        if not dev:
+            raise RuntimeError(
+                f"{self.name}: database schema is not up to date "
+                f"({(stored or 'none')[:12]}, expected {self.fingerprint[:12]}). "
+                "Run `alembic upgrade head` for changed tables, then `python -m common.schema` "
+                "for new tables and indexes, or set SCHEMA_MODE=dev."
+            )
+        await self.apply(dev=True)
+        return True
+
+    def _apply(self, connection: Connection, dev: bool) -> None:
+        existing = set(inspect(connection).get_table_names())
+        self.metadata.create_all(connection, checkfirst=True)
+        missing = missing_columns(connection, self.metadata, existing)
+        if dev:
+            # a nullable column is added as is, anything else needs a migration
+            for column in [c for c in missing if c.nullable and not c.primary_key]:
+                add_column(connection, column)
+                missing.remove(column)
+        if missing:
+            names = ", ".join(f"{c.table.name}.{c.name}" for c in missing)
+            raise RuntimeError(
+                f"{self.name}: columns missing in the database: {names}. "
+                "create_all can't alter tables, add them with an Alembic migration."
+            )
+        create_missing_indexes(connection, self.metadata)
+        if self.create is not None:
+            self.create(connection)
+        fingerprints.create(connection, checkfirst=True)
+        connection.execute(delete(fingerprints).where(fingerprints.c.name == self.name))
+        connection.execute(insert(fingerprints).values(name=self.name, fingerprint=self.fingerprint))
+
+    async def apply(self, dev: bool = False) -> None:
+        async with self.engine.begin() as connection:
+            await connection.run_sync(self._apply, dev)
+        logger.info("%s: schema applied, fingerprint %s", self.name, self.fingerprint[:12])
+
+
+async def main() -> int:
+    # importing the app registers the schemas of every database; this file
+    # runs as __main__, the registry is the one of the imported module
+    import main as app  # noqa: F401
+    from common.schema import registry
+
+    engines = {id(schema.engine): schema.engine for schema in registry}
+    failed = False
+    try:
+        for schema in registry:
+            if await schema.stored() == schema.fingerprint:
+                print(f"{schema.name}: up to date")
+                continue
+            try:
+                await schema.apply()
+            except RuntimeError as e:
+                print(e)
+                failed = True
+            else:
+                print(f"{schema.name}: applied")
+    finally:
+        for engine in engines.values():
+            await engine.dispose()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
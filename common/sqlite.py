@@ -0,0 +1,115 @@
+import sqlite3
+from functools import cache
+
+from sqlalchemy import Engine, create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from common.routing import RoutingMixin
+
+# One performance profile for every SQLite database in the repo. WAL lets
+# readers run while a write is in progress, synchronous=NORMAL only syncs at
+# checkpoints (still safe with WAL, a power cut can lose the last commits),
+# reads go through mmap and a bigger page cache, and a busy writer is waited
+# for instead of failing with "database is locked" right away.
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    # negative: KiB, so 64 MB
+    "cache_size": -64_000,
+    "busy_timeout": 5000,
+    "temp_store": "MEMORY",
+}
+
+
+def apply_pragmas(dbapi_connection, connection_record=None) -> None:
+    cursor = dbapi_connection.cursor()
+    for name, value in PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """sqlite3.connect with the profile applied, for plain sqlite3 scripts."""
+    connection = sqlite3.connect(path, timeout=PRAGMAS["busy_timeout"] / 1000)
+    apply_pragmas(connection)
+    return connection
+
+
+def _begin_immediate(engine: Engine) -> None:
+    # pysqlite only opens a transaction at the first DML statement, upgrading a
+    # read lock then is what deadlocks into "database is locked". Take the
+    # write lock when the transaction starts.
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _begin(connection):
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+@cache
+def _routing(session_class: type[Session]) -> type[Session]:
+    routing = type(f"SQLite{session_class.__name__}", (RoutingMixin, session_class), {})
+
+    # unlike replicas the readers open the same file and see a commit at once,
+    # so a session goes back to them when its transaction ends instead of
+    # holding the single writer for the rest of the request
+    @event.listens_for(routing, "after_transaction_end")
+    def _release_writer(session, transaction):
+        if transaction.parent is None:
+            session.info.pop("writer", None)
+
+    return routing
+
+
+class SQLiteDatabase:
+    """One SQLite file behind a pool of readers and a single writer connection.
+
+    Writers queue for the writer connection instead of racing each other into
+    lock errors, reads stay concurrent. Works with sqlite:// and
+    sqlite+aiosqlite:// URLs; sessions from `sessionmaker()` route by statement,
+    and hold the writer from their first write until commit or rollback.
+    """
+
+    def __init__(self, url: str, **kw):
+        self.is_async = make_url(url).get_dialect().is_async
+        create = create_async_engine if self.is_async else create_engine
+        connect_args = {"check_same_thread": False}
+        self.read_engine = create(url, connect_args=connect_args, **kw)
+        self.write_engine = create(
+            url, connect_args=connect_args, pool_size=1, max_overflow=0, **kw
+        )
+        for engine in (self.read_engine, self.write_engine):
+            event.listen(self._sync(engine), "connect", apply_pragmas)
+        _begin_immediate(self._sync(self.write_engine))
+
+    @staticmethod
+    def _sync(engine) -> Engine:
+        return getattr(engine, "sync_engine", engine)
+
+    @property
+    def writer(self) -> Engine:
+        return self._sync(self.write_engine)
+
+    def reader(self) -> Engine:
+        return self._sync(self.read_engine)
+
+    def sessionmaker(self, class_: type | None = None, **kw):
+        if self.is_async:
+            class_ = class_ or AsyncSession
+            sync_class = _routing(kw.pop("sync_session_class", class_.sync_session_class))
+            return async_sessionmaker(
+                class_=class_, sync_session_class=sync_class, router=self, **kw
+            )
+        return sessionmaker(class_=_routing(class_ or Session), router=self, **kw)
+
+    async def dispose(self) -> None:
+        for engine in (self.read_engine, self.write_engine):
+            result = engine.dispose()
+            if self.is_async:
+                await result
@@ -0,0 +1,424 @@
+"""Request tracing, without a collector.
+
+Every HTTP request is a trace (the Tracing middleware). Inside it, spans are
+opened automatically for
+
+- SQL statements on every engine (SQLAlchemy cursor events)
+- Redis commands and pipelines (redis.asyncio)
+- password hashing and verification (passlib)
+- Jinja template rendering
+
+and by hand with `with tracing.span("name", key=value):`.
+
+Ids follow W3C Trace Context: a `traceparent` header on the request is
+continued, and the response carries one for the request's span. The trace id
+is also bound to the log records of the request (common.logs), next to the
+request id. Finished traces go to a ring buffer holding the last
+TRACE_BUFFER of them, which GET /traces/slowest reads. With TRACE_FILE they
+are also appended to a file as OTLP/JSON lines, one ExportTraceServiceRequest
+per trace, which the OpenTelemetry collector's otlpjsonfile receiver reads.
+"""
+
+import heapq
+import json
+import logging
+import queue
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, HTTPException, Query
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+from common import logs
+
+logger = logging.getLogger(__name__)
+
+
+class TraceSettings(BaseSettings):
+    model_config = SettingsConfigDict(extra="ignore")
+    TRACE_ENABLED: bool = True
+    TRACE_BUFFER: int = 1000
+    TRACE_FILE: str | None = None
+    TRACE_SERVICE: str = "playground"
+
+
+settings = TraceSettings()
+
+# OTLP span kinds
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+STATEMENT_LENGTH = 1000
+# a request running a query per row would otherwise keep them all
+MAX_SPANS = 1000
+EXPORT_QUEUE = 1000
+
+_current: ContextVar["Span | None"] = ContextVar("trace_span", default=None)
+
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "attributes", "start", "end", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: str | None, kind: int, attributes: dict):
+        self.trace = trace
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.start = time.time_ns()
+        self.end: int | None = None
+        self.error: str | None = None
+        trace.add(self)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.time_ns()) - self.start) / 1e6
+
+    def finish(self, error: BaseException | None = None) -> None:
+        self.end = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+
+    def otlp(self) -> dict:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end or self.start),
+            "attributes": [_attribute(k, v) for k, v in self.attributes.items() if v is not None],
+            # STATUS_CODE_OK = 1, STATUS_CODE_ERROR = 2
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class Trace:
+    def __init__(self, trace_id: str | None = None, request_id: str | None = None):
+        self.trace_id = trace_id or f"{random.getrandbits(128):032x}"
+        self.request_id = request_id
+        self.spans: list[Span] = []
+        self.dropped = 0
+
+    def add(self, span: Span) -> None:
+        if len(self.spans) < MAX_SPANS:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+    @property
+    def duration_ms(self) -> float:
+        return self.root.duration_ms
+
+    def summary(self, top: int = 5) -> dict:
+        # time per kind of operation: "db.query" -> db, "redis HGET" -> redis
+        breakdown: dict[str, float] = {}
+        for span in self.spans[1:]:
+            kind = span.name.split(" ")[0].split(".")[0]
+            breakdown[kind] = breakdown.get(kind, 0.0) + span.duration_ms
+        return {
+            "trace_id": self.trace_id,
+            "request_id": self.request_id,
+            "name": self.root.name,
+            "status": self.root.attributes.get("http.response.status_code"),
+            "start": datetime.fromtimestamp(self.root.start / 1e9, timezone.utc).isoformat(),
+            "duration_ms": round(self.duration_ms, 3),
+            "spans": len(self.spans) + self.dropped,
+            "breakdown_ms": {kind: round(ms, 3) for kind, ms in breakdown.items()},
+            "slowest_spans": [
+                {"name": span.name, "duration_ms": round(span.duration_ms, 3), **span.attributes}
+                for span in heapq.nlargest(top, self.spans[1:], key=lambda span: span.duration_ms)
+            ],
+        }
+
+    def otlp(self) -> dict:
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": [_attribute("service.name", settings.TRACE_SERVICE)]},
+                    "scopeSpans": [
+                        {"scope": {"name": __name__}, "spans": [span.otlp() for span in self.spans]}
+                    ],
+                }
+            ]
+        }
+
+
+# * spans
+
+
+def start_span(name: str, kind: int = INTERNAL, **attributes) -> tuple[Span, Token] | None:
+    """Open a child of the current span; None outside of a trace."""
+    parent = _current.get()
+    if parent is None:
+        return None
+    child = Span(parent.trace, name, parent.span_id, kind, attributes)
+    return child, _current.set(child)
+
+
+def end_span(started: tuple[Span, Token] | None, error: BaseException | None = None) -> None:
+    if started is None:
+        return
+    child, token = started
+    child.finish(error)
+    _current.reset(token)
+
+
+@contextmanager
+def span(name: str, kind: int = INTERNAL, **attributes):
+    started = start_span(name, kind, **attributes)
+    error = None
+    try:
+        yield started[0] if started else None
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        end_span(started, error)
+
+
+# * export
+
+
+class TraceBuffer:
+    """The last `size` finished traces."""
+
+    def __init__(self, size: int):
+        self.traces: deque[Trace] = deque(maxlen=size)
+
+    def add(self, trace: Trace) -> None:
+        self.traces.append(trace)
+
+    def slowest(self, limit: int, name: str | None = None) -> list[Trace]:
+        traces = (t for t in self.traces if name is None or t.root.name == name)
+        return heapq.nlargest(limit, traces, key=lambda trace: trace.duration_ms)
+
+    def get(self, trace_id: str) -> Trace | None:
+        return next((t for t in self.traces if t.trace_id == trace_id), None)
+
+
+class FileExporter:
+    """Appends traces to `path` as OTLP/JSON lines, from a background thread."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.queue: queue.Queue = queue.Queue(EXPORT_QUEUE)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._write, name="trace-export", daemon=True)
+        self.thread.start()
+
+    def export(self, trace: Trace) -> None:
+        try:
+            self.queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _write(self) -> None:
+        with open(self.path, "a") as file:
+            while (trace := self.queue.get()) is not None:
+                file.write(json.dumps(trace.otlp()) + "\n")
+                file.flush()
+
+    def close(self) -> None:
+        self.queue.put(None)
+        self.thread.join()
+        if self.dropped:
+            logger.warning("tracing: %d traces not written, queue full", self.dropped)
+
+
+buffer = TraceBuffer(settings.TRACE_BUFFER)
+file_exporter = FileExporter(settings.TRACE_FILE) if settings.TRACE_FILE else None
+
+
+def export(trace: Trace) -> None:
+    buffer.add(trace)
+    if file_exporter is not None:
+        file_exporter.export(trace)
+
+
+def stop() -> None:
+    if file_exporter is not None:
+        file_exporter.close()
+
+
+# * instrumentation
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._trace_span = start_span(
+            "db.query",
+            CLIENT,
+            **{"db.system": conn.dialect.name, "db.statement": statement[:STATEMENT_LENGTH]},
+        )
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    end_span(getattr(context, "_trace_span", None))
+
+
+def _handle_error(exception_context):
+    end_span(
+        getattr(exception_context.execution_context, "_trace_span", None),
+        exception_context.original_exception,
+    )
+
+
+def _traced_async(method, name, **attributes):
+    async def traced(self, *args, **kwargs):
+        if _current.get() is None:
+            return await method(self, *args, **kwargs)
+        span_name = name(self, args) if callable(name) else name
+        with span(span_name, CLIENT, **attributes):
+            return await method(self, *args, **kwargs)
+
+    return traced
+
+
+def _traced(method, name, **attributes):
+    def traced(self, *args, **kwargs):
+        if _current.get() is None:
+            return method(self, *args, **kwargs)
+        with span(name(self, args) if callable(name) else name, **attributes):
+            return method(self, *args, **kwargs)
+
+    return traced
+
+
+_instrumented = False
+
+
+def instrument() -> None:
+    """Hook the libraries above, once; does nothing with TRACE_ENABLED off."""
+    global _instrumented
+    if _instrumented or not settings.TRACE_ENABLED:
+        return
+    _instrumented = True
+
+    from jinja2 import Template
+    from passlib.context import CryptContext
+    from redis.asyncio.client import Pipeline, Redis
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+
+    Redis.execute_command = _traced_async(
+        Redis.execute_command, lambda self, args: f"redis {args[0]}", **{"db.system": "redis"}
+    )
+    Pipeline.execute = _traced_async(Pipeline.execute, "redis pipeline", **{"db.system": "redis"})
+
+    CryptContext.hash = _traced(CryptContext.hash, "password.hash")
+    CryptContext.verify = _traced(CryptContext.verify, "password.verify")
+
+    Template.render = _traced(Template.render, lambda self, args: f"template.render {self.name}")
+
+
+# version-traceid-parentid-flags, later versions may append fields
+_TRACEPARENT = re.compile(r"([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}(-.*)?")
+
+
+def _traceparent(header: bytes | None) -> tuple[str | None, str | None]:
+    match = _TRACEPARENT.fullmatch(header.decode("latin-1")) if header else None
+    if match is None:
+        return None, None
+    version, trace_id, parent_id, extra = match.groups()
+    if version == "ff" or (version == "00" and extra):
+        return None, None
+    # all-zero ids are invalid
+    if not int(trace_id, 16) or not int(parent_id, 16):
+        return None, None
+    return trace_id, parent_id
+
+
+class Tracing:
+    """ASGI middleware: a trace for every HTTP request.
+
+    Add it inside logs.RequestContext so the trace gets the request id."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.TRACE_ENABLED:
+            return await self.app(scope, receive, send)
+        trace_id, parent_id = _traceparent(dict(scope["headers"]).get(b"traceparent"))
+        trace = Trace(trace_id, logs.current().get("request_id"))
+        root = Span(
+            trace,
+            f"{scope['method']} {scope['path']}",
+            parent_id,
+            SERVER,
+            {"http.request.method": scope["method"], "url.path": scope["path"]},
+        )
+        token = _current.set(root)
+        logs.bind(trace_id=trace.trace_id)
+
+        async def send_traced(message):
+            if message["type"] == "http.response.start":
+                root.attributes["http.response.status_code"] = message["status"]
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"traceparent", f"00-{trace.trace_id}-{root.span_id}-01".encode()),
+                ]
+            await send(message)
+
+        error = None
+        try:
+            await self.app(scope, receive, send_traced)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _current.reset(token)
+            # routing put the matched route in the scope: name the span after its
+            # template, so /books/{uid} is one name rather than one per uid
+            route = getattr(scope.get("route"), "path", None)
+            if route is not None:
+                root.name = f"{scope['method']} {route}"
+                root.attributes["http.route"] = route
+            root.finish(error)
+            export(trace)
+
+
+router = APIRouter(prefix="/traces", tags=["tracing"])
+
+
+@router.get("/slowest")
+async def slowest_traces(
+    limit: int = Query(10, ge=1, le=100), name: str | None = None
+):
+    """The slowest of the recent traces, `name` is e.g. "GET /book_a1/books/{uid}"."""
+    return [trace.summary() for trace in buffer.slowest(limit, name)]
+
+
+@router.get("/{trace_id}")
+async def get_trace(trace_id: str):
+    trace = buffer.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="trace not in the buffer")
+    return trace.otlp()
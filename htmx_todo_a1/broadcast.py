@@ -0,0 +1,62 @@
+import asyncio
+from collections import deque
+from typing import AsyncIterator
+
+# Pushes rendered fragments to every open page of this worker over SSE.
+# Fragments published within `window` seconds go out as one message, and all
+# idle connections wait on one shared Event instead of a queue each, so a
+# broadcast costs one wakeup per connection no matter how many fragments it has.
+# A client never gets back the fragments of its own requests, it already
+# swapped the response.
+
+HEARTBEAT_INTERVAL = 15
+
+
+class Broadcaster:
+    def __init__(self, window: float = 0.05, history: int = 256):
+        self.window = window
+        self.connections = 0
+        self._pending: list[tuple[str, str | None]] = []
+        self._batches: deque[tuple[int, list[tuple[str, str | None]]]] = deque(maxlen=history)
+        self._seq = 0
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._wakeup = asyncio.Event()
+
+    def publish(self, fragment: str, origin: str | None = None) -> None:
+        self._pending.append((fragment, origin))
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.window, self._flush)
+
+    def _flush(self) -> None:
+        self._flush_handle = None
+        self._seq += 1
+        self._batches.append((self._seq, self._pending))
+        self._pending = []
+        wakeup, self._wakeup = self._wakeup, asyncio.Event()
+        wakeup.set()
+
+    async def listen(self, client: str | None) -> AsyncIterator[str]:
+        seen = self._seq
+        self.connections += 1
+        try:
+            while True:
+                # batches flushed while this generator was suspended at a yield
+                # already set the Event it would wait on, so check first
+                if self._seq == seen:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), HEARTBEAT_INTERVAL)
+                    except TimeoutError:
+                        yield ": ping\n\n"
+                        continue
+                html = "".join(
+                    fragment
+                    for seq, batch in self._batches
+                    if seq > seen
+                    for fragment, origin in batch
+                    if client is None or origin != client
+                )
+                seen = self._seq
+                if html:
+                    yield "".join(f"data: {line}\n" for line in html.splitlines()) + "\n"
+        finally:
+            self.connections -= 1
@@ -1,8 +1,18 @@
-from fastapi import APIRouter, Depends, FastAPI, Form, Request, status
-from fastapi.responses import HTMLResponse
+import logging
+from typing import Annotated
+from uuid import uuid4
+
+from fastapi import APIRouter, Depends, FastAPI, Form, Header, Request, status
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from sqlmodel import Field, Session, SQLModel, create_engine
+from sqlmodel import Field, Session, SQLModel
+
+from common.sqlite import SQLiteDatabase
+from htmx_todo_a1.broadcast import Broadcaster
+
+
+logger = logging.getLogger(__name__)
 
 
 class Todo(SQLModel, table=True):
@@ -12,14 +22,14 @@ class Todo(SQLModel, table=True):
     completed: bool = Field(default=False)
 
 
-engine = create_engine(
-    "sqlite:///./htmx_todo_a1/sqlite.db", connect_args={"check_same_thread": False}
-)
+database = SQLiteDatabase("sqlite:///./htmx_todo_a1/sqlite.db")
+engine = database.write_engine
 SQLModel.metadata.create_all(bind=engine)
+SessionLocal = database.sessionmaker(class_=Session)
 
 
 def get_session():
-    with Session(engine) as session:
+    with SessionLocal() as session:
         yield session
 
 
@@ -28,6 +38,22 @@ router = APIRouter(tags=["htmx_todo_a1"], prefix="/htmx_todo_a1")
 
 templates = Jinja2Templates(directory="htmx_todo_a1/templates")
 
+# other open pages get every change as out-of-band swaps
+broadcaster = Broadcaster()
+
+
+def render_task(todo: Todo, oob: bool = True) -> str:
+    return templates.get_template("task.html").render(todo=todo, oob=oob)
+
+
+@router.get("/events")
+async def events(x_client_id: Annotated[str | None, Header()] = None):
+    return StreamingResponse(
+        broadcaster.listen(x_client_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # @router.post("/create", response_model=Todo, status_code=status.HTTP_201_CREATED)
 # async def create1(request: Request, session: Session = Depends(get_session)):
 #     data = dict(await request.form())
@@ -77,14 +103,18 @@ async def create4(request: Request, session: Session = Depends(get_session)):
         data = dict(await request.form())
     data["completed"] = data.get("completed", False)
     obj = Todo(**data)
-    print("Received new task:", obj)
     session.add(obj)
     session.commit()
     session.refresh(obj)
+    logger.debug("todo created", extra={"todo_id": obj.id})
     # return obj
     # todos = session.query(Todo).all()
     # return templates.TemplateResponse("todo_list.html", {"request": request, "todos": todos})
     todo = session.query(Todo).get(obj.id)
+    broadcaster.publish(
+        f'<div hx-swap-oob="beforeend:#goal">{render_task(todo, oob=False)}</div>',
+        request.headers.get("x-client-id"),
+    )
     return templates.TemplateResponse("task.html", {"request": request, "todo": todo})
 
 
@@ -92,7 +122,7 @@ async def create4(request: Request, session: Session = Depends(get_session)):
 async def root(request: Request, todo: Todo = Depends(get_session)):
     todos = todo.query(Todo).all()
     return templates.TemplateResponse(
-        "index.html", {"request": request, "todos": todos}
+        "index.html", {"request": request, "todos": todos, "client_id": uuid4().hex}
     )
 
 
@@ -121,16 +151,16 @@ async def toggle2(request: Request, session: Session = Depends(get_session)):
         data = await request.json()
     except Exception:
         data = dict(await request.form())
-        print("data", data)
     todo_id = int(data.get("id"))
     todo = session.query(Todo).get(todo_id)
     if not todo:
         return "<div>not found</div>"
     todo.completed = not todo.completed
-    print("class", todo)
+    logger.debug("todo toggled", extra={"todo_id": todo_id, "completed": todo.completed})
     session.add(todo)
     session.commit()
     session.refresh(todo)
+    broadcaster.publish(render_task(todo), request.headers.get("x-client-id"))
     return templates.TemplateResponse("task.html", {"request": request, "todo": todo})
 
 
@@ -138,7 +168,6 @@ async def toggle2(request: Request, session: Session = Depends(get_session)):
 async def get_form(
     request: Request, session: Session = Depends(get_session), todo_id: int = None
 ):
-    print("edit", todo_id)
     todo = session.query(Todo).get(todo_id)
     if not todo:
         return "<div>not found</div>"
@@ -151,22 +180,28 @@ async def get_form(
 async def edit(
     request: Request, session: Session = Depends(get_session), todo_id: int = None
 ):
-    print("type:", type(todo_id), "todo_id: ", todo_id)
     try:
         data = await request.json()
     except Exception:
         data = dict(await request.form())
-        print("data", data)
+    try:
+        priority = int(data["priority"]) if data.get("priority") else None
+    except (TypeError, ValueError):
+        return HTMLResponse(
+            '<div class="text-red-500">priority must be a whole number</div>',
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
     todo = session.query(Todo).get(todo_id)
-    print("before", todo)
-    todo = Todo(**data)
-    print("after", todo)
     if not todo:
         return "<div>not found</div>"
     todo.task = data.get("task")
+    if priority is not None:
+        todo.priority = priority
+    logger.debug("todo edited", extra={"todo_id": todo_id})
     session.add(todo)
     session.commit()
     session.refresh(todo)
+    broadcaster.publish(render_task(todo), request.headers.get("x-client-id"))
     return templates.TemplateResponse("task.html", {"request": request, "todo": todo})
 
 
@@ -178,10 +213,14 @@ async def edit(
 async def delete(
     request: Request, session: Session = Depends(get_session), todo_id: int = None
 ):
-    print("delete", todo_id)
+    logger.debug("todo deleted", extra={"todo_id": todo_id})
     todo = session.query(Todo).get(todo_id)
     if not todo:
         return "<div>not found</div>"
     session.delete(todo)
     session.commit()
+    broadcaster.publish(
+        f'<li id="li-{todo_id}" hx-swap-oob="delete"></li>',
+        request.headers.get("x-client-id"),
+    )
     return '<div class="text-red-500">deleted</div>'
@@ -1,25 +1,42 @@
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from fastapi.staticfiles import StaticFiles
 
 from auth_a1 import main as auth_a1_main
 from auth_b1.main import router as auth_b1_router
 from book_a1 import api as book_a1_api
+from book_a1.auth import RoleChecker
+from book_a1.book import suggestion_rows
+from book_a1.db import revoked_tokens as book_a1_revoked_tokens
+from book_a1.suggest import book_suggestions
+from common import logs, tracing
 from htmx_todo_a1.main import router as htmx_todo_a1_main
 from learning import api as learning_api
 from shipping_a1 import api as shipping_a1_api
+from shipping_a1.db import revoked_tokens as shipping_a1_revoked_tokens
+from shipping_a1.events import shipment_events
+from shipping_a1.ship import aggregate_shipments
+from shipping_a1.stats import shipment_stats
 from todo_a1 import main as todo_a1_main
 
 # print(f"___{auth_a1_main}")
 
+tracing.instrument()
+
+revocation_stores = (
+    book_a1_revoked_tokens,
+    auth_a1_main.revoked_tokens,
+    shipping_a1_revoked_tokens,
+)
+
 @asynccontextmanager
 async def async_lifespan(app: FastAPI):
+    logs.start()
     try:
         await book_a1_api.db.init()
         print("book_a1 started")
-        async with auth_a1_main.engine.begin() as connection:
-            await connection.run_sync(auth_a1_main.auth_a1_meta.create_all)
+        await auth_a1_main.schema.ensure()
         print("run shipping_a1")
         await shipping_a1_api.db()
     except RuntimeError as e:
@@ -27,10 +44,25 @@ async def async_lifespan(app: FastAPI):
         print(f"\nReason: {str(e)}")
         print("=" * 50)
         raise
+    for store in revocation_stores:
+        await store.start()
+    shipment_stats.start(aggregate_shipments)
+    await shipment_events.start()
+    await book_suggestions.start(suggestion_rows)
     yield
     print("shutdown ALL_APPS")
+    for store in revocation_stores:
+        await store.stop()
+    await shipment_stats.stop()
+    await shipment_events.stop()
+    await book_suggestions.stop()
+    # the memory backend writes its snapshot here
+    for store in revocation_stores:
+        await store.redis.aclose()
     await book_a1_api.db.close()
-    await auth_a1_main.engine.dispose()
+    await auth_a1_main.database.dispose()
+    tracing.stop()
+    logs.stop()
 
 app = FastAPI(
     title="playground",
@@ -38,6 +70,9 @@ app = FastAPI(
     version="0.1",
     lifespan=async_lifespan,
 )
+# the last one added runs first: request id, then the trace
+app.add_middleware(tracing.Tracing)
+app.add_middleware(logs.RequestContext)
 app.include_router(book_a1_api.router)
 app.include_router(htmx_todo_a1_main)
 app.include_router(auth_b1_router)
@@ -50,6 +85,7 @@ app.include_router(auth_a1_main.router)
 app.include_router(shipping_a1_api.router)
 app.include_router(learning_api.router)
 app.include_router(todo_a1_main.router)
+app.include_router(tracing.router, dependencies=[Depends(RoleChecker(["admin"]))])
 
 
 if __name__ == "__main__":
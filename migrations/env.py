@@ -9,7 +9,10 @@ from sqlmodel import SQLModel
 
 from book_a1.auth import User
 from book_a1.book import Book
-from book_a1.db import settings
+from book_a1.db import book_a1_meta, settings
+from book_a1.search import include_name as include_search_name
+from common.backfill import checkpoints
+from common.schema import fingerprints
 
 database_url = settings.DATABASE_URL
 # this is the Alembic Config object, which provides
@@ -20,7 +23,16 @@ config.set_main_option("sqlalchemy.url", database_url)
 # This line sets up loggers basically.
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
-target_metadata = SQLModel.metadata
+# books lives in its own MetaData, without it autogenerate wants to drop the table
+target_metadata = [SQLModel.metadata, book_a1_meta]
+
+
+def include_name(name, type_, parent_names) -> bool:
+    # backfill checkpoints and schema fingerprints are bookkeeping, not models
+    if name in (checkpoints.name, fingerprints.name):
+        return False
+    return include_search_name(name, type_, parent_names)
+
 
 # add your model's MetaData object here
 # for 'autogenerate' support
@@ -49,6 +61,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_name=include_name,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -58,7 +71,13 @@ def run_migrations_offline() -> None:
 
 
 def do_run_migrations(connection: Connection) -> None:
-    context.configure(connection=connection, target_metadata=target_metadata)
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        include_name=include_name,
+        # a revision that ran stays applied when a later one (or its backfill) fails
+        transaction_per_migration=True,
+    )
 
     with context.begin_transaction():
         context.run_migrations()
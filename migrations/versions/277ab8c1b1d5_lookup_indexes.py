@@ -0,0 +1,31 @@
+"""index hot lookup columns
+
+Revision ID: 277ab8c1b1d5
+Revises: 6f0909025c0a
+Create Date: 2026-10-19 10:12:40.118530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '277ab8c1b1d5'
+down_revision: Union[str, Sequence[str], None] = '6f0909025c0a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_users_email'), 'users', ['email'], unique=False, if_not_exists=True)
+    # books is created by book_a1 Database.init, it may not exist yet
+    if sa.inspect(op.get_bind()).has_table('books'):
+        op.create_index(op.f('ix_books_created_at'), 'books', ['created_at'], unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_books_created_at'), table_name='books', if_exists=True)
+    op.drop_index(op.f('ix_users_email'), table_name='users', if_exists=True)
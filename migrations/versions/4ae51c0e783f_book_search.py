@@ -0,0 +1,51 @@
+"""full-text search column for books
+
+Revision ID: 4ae51c0e783f
+Revises: 277ab8c1b1d5
+Create Date: 2026-10-19 13:02:11.402377
+
+"""
+import logging
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+# revision identifiers, used by Alembic.
+revision: str = '4ae51c0e783f'
+down_revision: Union[str, Sequence[str], None] = '277ab8c1b1d5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # SQLite gets its FTS5 table from book_a1 Database.init
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+    if not sa.inspect(bind).has_table('books'):
+        # book_a1.search.create_search_column adds both when the app creates books
+        logger.info('No books table, search_vector is created with it')
+        return
+    op.execute(
+        """
+        ALTER TABLE books ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', coalesce(title, '')), 'A')
+            || setweight(to_tsvector('simple', coalesce(author, '')), 'B')
+            || setweight(to_tsvector('simple', coalesce(publisher, '')), 'C')
+        ) STORED
+        """
+    )
+    op.execute('CREATE INDEX IF NOT EXISTS ix_books_search ON books USING GIN (search_vector)')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('DROP INDEX IF EXISTS ix_books_search')
+    op.execute('ALTER TABLE books DROP COLUMN IF EXISTS search_vector')
@@ -3,13 +3,21 @@ from typing import Annotated
 from uuid import uuid4
 
 from fastapi import Depends
+from pydantic import model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from sqlalchemy import MetaData
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from common.kv import Backend, kv_backend
+from common.revocation import RevocationStore
+from common.schema import Schema
 from shipping_a1.main import Redis
 
+# the low SHARD_BITS bits of a shipment id name its bucket, see shipping_a1/shards.py
+SHARD_BITS = 6
+BUCKETS = 1 << SHARD_BITS
+
 
 class DataBaseSettings(BaseSettings):
     POSTGRES_HOST: str
@@ -21,6 +29,23 @@ class DataBaseSettings(BaseSettings):
     JWT_ALGORITHM: str
     REDIS_HOST: str
     REDIS_PORT: int
+    REVOKED_FILTER_CAPACITY: int = 100_000
+    REVOKED_FILTER_ERROR_RATE: float = 0.001
+    STATS_RECONCILE_INTERVAL: int = 300
+    EVENTS_MAX_CONNECTIONS: int = 1000
+    EVENTS_HEARTBEAT_INTERVAL: int = 15
+    EVENTS_STREAM_MAXLEN: int = 100
+    EVENTS_STREAM_TTL: int = 7 * 24 * 3600
+    # shipment shards as a JSON list of URLs, empty keeps shipments on POSTGRES_URL
+    SHARD_URLS: list[str] = []
+    # bucket -> index in SHARD_URLS, buckets not listed go to bucket % shards
+    SHARD_PLACEMENT: dict[int, int] = {}
+    # full URL instead of the POSTGRES_* parts, e.g. a SQLite file for benchmarks;
+    # not DATABASE_URL, which is book_a1's database
+    SHIPPING_DATABASE_URL: str | None = None
+    # "memory": blocklist in-process, single worker only (stats and events stay on Redis)
+    KV_BACKEND: Backend = "redis"
+    SHIPPING_KV_SNAPSHOT_PATH: str | None = None
     model_config = SettingsConfigDict(
         env_file=Path(__file__).parent / ".env",
         env_file_encoding="utf-8",
@@ -28,8 +53,21 @@ class DataBaseSettings(BaseSettings):
         extra="ignore",
     )
 
+    @model_validator(mode="after")
+    def check_placement(self):
+        # a typo here would route a bucket to no database at all, refuse to start
+        shards = len(self.SHARD_URLS) or 1
+        for bucket, shard in self.SHARD_PLACEMENT.items():
+            if not 0 <= bucket < BUCKETS:
+                raise ValueError(f"SHARD_PLACEMENT: bucket {bucket} not in 0..{BUCKETS - 1}")
+            if not 0 <= shard < shards:
+                raise ValueError(f"SHARD_PLACEMENT: bucket {bucket} -> no shard {shard}")
+        return self
+
     @property
     def POSTGRES_URL(self):
+        if self.SHIPPING_DATABASE_URL:
+            return self.SHIPPING_DATABASE_URL
         return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
 
 
@@ -37,30 +75,43 @@ settings = DataBaseSettings()
 # print(settings.POSTGRES_URL)
 
 token_blacklist = Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0)
+revocation_kv = (
+    token_blacklist
+    if settings.KV_BACKEND == "redis"
+    else kv_backend(settings.KV_BACKEND, settings.SHIPPING_KV_SNAPSHOT_PATH)
+)
+revoked_tokens = RevocationStore(
+    revocation_kv,
+    namespace="shipping_a1:revoked",
+    filter_capacity=settings.REVOKED_FILTER_CAPACITY,
+    filter_error_rate=settings.REVOKED_FILTER_ERROR_RATE,
+)
 
 
-async def add_jti_to_blocklist(jti: str):
-    await token_blacklist.set(jti, "blacklisted")
+async def add_jti_to_blocklist(jti: str, exp: int):
+    await revoked_tokens.revoke(jti, exp)
 
 
 async def check_jti(jti: str):
-    return await token_blacklist.exists(jti)
+    return await revoked_tokens.is_revoked(jti)
 
 
 engine = create_async_engine(url=settings.POSTGRES_URL, echo=True)
 shipping_a1_meta = MetaData()
+schema = Schema("shipping_a1", engine, shipping_a1_meta)
 
 
 async def create_db_and_tables():
-    async with engine.begin() as conn:
-        await conn.run_sync(shipping_a1_meta.create_all)
+    await schema.ensure()
+
+
+async_session = async_sessionmaker(
+    bind=engine, class_=AsyncSession, expire_on_commit=False
+)
 
 
 async def get_session() -> AsyncSession:
-    session = async_sessionmaker(
-        bind=engine, class_=AsyncSession, expire_on_commit=False
-    )
-    async with session() as s:
+    async with async_session() as s:
         yield s
 
 
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import logging
+import re
+from typing import AsyncIterator
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from shipping_a1.db import settings, token_blacklist
+
+logger = logging.getLogger(__name__)
+
+# Status transitions of a shipment, pushed to tracking pages as Server-Sent Events.
+# Every transition is appended to a short per-shipment Redis stream (for
+# Last-Event-ID replay, the stream id is the SSE id) and published on a single
+# channel. Each worker holds one pub/sub connection and hands events to the
+# local subscribers of that shipment. If the pub/sub connection drops, all
+# local streams are closed; browsers reconnect with Last-Event-ID and get what
+# they missed from the stream.
+
+RETRY_DELAY = 1.0
+CLIENT_RETRY_MS = 3000
+EVENT_ID = re.compile(r"^\d+-\d+$")
+
+
+def _event_key(event_id: str) -> tuple[int, int]:
+    ms, seq = event_id.split("-")
+    return int(ms), int(seq)
+
+
+def _frame(event_id: str, data: str) -> str:
+    return f"id: {event_id}\nevent: status\ndata: {data}\n\n"
+
+
+class ShipmentEvents:
+    def __init__(
+        self,
+        redis: Redis,
+        namespace: str,
+        max_connections: int,
+        heartbeat: int,
+        stream_maxlen: int,
+        stream_ttl: int,
+    ):
+        self.redis = redis
+        self.namespace = namespace
+        self.channel = f"{namespace}:channel"
+        self.max_connections = max_connections
+        self.heartbeat = heartbeat
+        self.stream_maxlen = stream_maxlen
+        self.stream_ttl = stream_ttl
+        self.connections = 0
+        self._queues: dict[int, set[asyncio.Queue]] = {}
+        self._listener: asyncio.Task | None = None
+
+    def _stream(self, shipment_id: int) -> str:
+        return f"{self.namespace}:stream:{shipment_id}"
+
+    async def publish(self, shipment_id: int, status: str, previous: str) -> None:
+        data = json.dumps({"shipment_id": shipment_id, "status": status, "previous": previous})
+        stream = self._stream(shipment_id)
+        try:
+            event_id = await self.redis.xadd(
+                stream, {"data": data}, maxlen=self.stream_maxlen, approximate=True
+            )
+            event_id = event_id.decode() if isinstance(event_id, bytes) else event_id
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.expire(stream, self.stream_ttl)
+                pipe.publish(
+                    self.channel,
+                    json.dumps({"id": event_id, "shipment_id": shipment_id, "data": data}),
+                )
+                await pipe.execute()
+        except RedisError as e:
+            # the update is committed, tracking pages just miss this push
+            logger.warning("shipment %s status event not published: %s", shipment_id, e)
+
+    def has_capacity(self) -> bool:
+        return self.connections < self.max_connections
+
+    async def stream(self, shipment_id: int, last_event_id: str | None) -> AsyncIterator[str]:
+        queue: asyncio.Queue = asyncio.Queue()
+        # register before replaying so nothing falls between replay and live events
+        self._queues.setdefault(shipment_id, set()).add(queue)
+        self.connections += 1
+        try:
+            yield f"retry: {CLIENT_RETRY_MS}\n\n"
+            last = _event_key(last_event_id) if last_event_id else None
+            if last_event_id:
+                for event_id, fields in await self.redis.xrange(
+                    self._stream(shipment_id), min=f"({last_event_id}"
+                ):
+                    event_id = event_id.decode() if isinstance(event_id, bytes) else event_id
+                    data = fields.get(b"data", fields.get("data"))
+                    yield _frame(event_id, data.decode() if isinstance(data, bytes) else data)
+                    last = _event_key(event_id)
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), self.heartbeat)
+                except TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if event is None:
+                    return
+                if last and _event_key(event["id"]) <= last:
+                    continue
+                yield _frame(event["id"], event["data"])
+                last = _event_key(event["id"])
+        finally:
+            subscribers = self._queues.get(shipment_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._queues[shipment_id]
+            self.connections -= 1
+
+    # * fan-out
+
+    async def start(self) -> None:
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    def _close_streams(self) -> None:
+        for subscribers in self._queues.values():
+            for queue in subscribers:
+                queue.put_nowait(None)
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    event = json.loads(message["data"])
+                    for queue in self._queues.get(event["shipment_id"], ()):
+                        queue.put_nowait(event)
+            except RedisError as e:
+                logger.warning("shipment events: pub/sub lost: %s", e)
+            finally:
+                # whatever is published until we are back is only in the streams
+                self._close_streams()
+                await pubsub.aclose()
+            await asyncio.sleep(RETRY_DELAY)
+
+
+shipment_events = ShipmentEvents(
+    token_blacklist,
+    namespace="shipping_a1:events",
+    max_connections=settings.EVENTS_MAX_CONNECTIONS,
+    heartbeat=settings.EVENTS_HEARTBEAT_INTERVAL,
+    stream_maxlen=settings.EVENTS_STREAM_MAXLEN,
+    stream_ttl=settings.EVENTS_STREAM_TTL,
+)
@@ -0,0 +1,191 @@
+"""Stream shipments out as CSV or NDJSON, optionally gzipped.
+
+    uv run python -m shipping_a1.export -o shipments.csv.gz --gzip --status delivered \
+        --delivery-from 2026-01-01 --delivery-to 2026-02-01
+
+Rows are read through a server-side cursor, `batch_size` at a time, from one
+shard after the other, so memory stays flat whatever the size of the table.
+The order of the rows is not defined.
+"""
+
+import argparse
+import asyncio
+import csv
+import datetime
+import io
+import json
+import resource
+import sys
+import time
+import zlib
+from collections.abc import AsyncIterator, Sequence
+from typing import Annotated, Literal
+
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from shipping_a1.db import engine
+from shipping_a1.seller import sellerDep
+from shipping_a1.shards import shards
+from shipping_a1.ship import Shipment, ShipmentStatus
+
+BATCH_SIZE = 5000
+GZIP_LEVEL = 5
+COLUMNS = ("id", "status", "content", "weight", "destination", "estimated_delivery")
+
+router = APIRouter(prefix="/ship", tags=["ship"])
+
+
+class ExportFilter(BaseModel):
+    status: ShipmentStatus | None = None
+    # estimated_delivery in [delivery_from, delivery_to)
+    delivery_from: datetime.datetime | None = None
+    delivery_to: datetime.datetime | None = None
+    format: Literal["csv", "ndjson"] = "csv"
+    gzip: bool = False
+
+
+def export_statement(filters: ExportFilter) -> Select:
+    # a Core select on the table: rows come back as tuples, the ORM loading
+    # layer and its identity map stay out of the loop
+    table = Shipment.__table__
+    statement = select(*(table.c[name] for name in COLUMNS))
+    if filters.status is not None:
+        statement = statement.where(table.c.status == filters.status)
+    if filters.delivery_from is not None:
+        statement = statement.where(table.c.estimated_delivery >= filters.delivery_from)
+    if filters.delivery_to is not None:
+        statement = statement.where(table.c.estimated_delivery < filters.delivery_to)
+    return statement
+
+
+def values(row: Sequence) -> list:
+    id, status, content, weight, destination, delivery = row
+    return [id, status.value, content, weight, destination, delivery.isoformat()]
+
+
+def encode_csv(rows: Sequence[Sequence]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(values(row) for row in rows)
+    return buffer.getvalue().encode()
+
+
+def encode_ndjson(rows: Sequence[Sequence]) -> bytes:
+    return "".join(
+        json.dumps(dict(zip(COLUMNS, values(row)))) + "\n" for row in rows
+    ).encode()
+
+
+class ShipmentExport:
+    def __init__(
+        self,
+        filters: ExportFilter,
+        sessionmakers: list[async_sessionmaker] | None = None,
+        batch_size: int = BATCH_SIZE,
+    ):
+        self.filters = filters
+        self.sessionmakers = sessionmakers or shards.sessionmakers
+        self.batch_size = batch_size
+        self.rows = 0
+
+    @property
+    def filename(self) -> str:
+        return f"shipments.{self.filters.format}" + (".gz" if self.filters.gzip else "")
+
+    @property
+    def media_type(self) -> str:
+        if self.filters.gzip:
+            return "application/gzip"
+        return "text/csv" if self.filters.format == "csv" else "application/x-ndjson"
+
+    async def batches(self) -> AsyncIterator[Sequence[Sequence]]:
+        statement = export_statement(self.filters).execution_options(yield_per=self.batch_size)
+        for maker in self.sessionmakers:
+            async with maker() as session:
+                connection = await session.connection()
+                result = await connection.stream(statement)
+                async for batch in result.partitions():
+                    self.rows += len(batch)
+                    yield batch
+
+    async def encoded(self) -> AsyncIterator[bytes]:
+        encode = encode_csv if self.filters.format == "csv" else encode_ndjson
+        if self.filters.format == "csv":
+            yield (",".join(COLUMNS) + "\r\n").encode()
+        async for batch in self.batches():
+            yield encode(batch)
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        if not self.filters.gzip:
+            async for chunk in self.encoded():
+                yield chunk
+            return
+        # wbits=31: gzip container instead of a bare zlib stream
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        async for chunk in self.encoded():
+            if compressed := compressor.compress(chunk):
+                yield compressed
+        yield compressor.flush()
+
+
+# curl -OJ "127.0.0.1:8000/shipping_a1/ship/export?status=delivered&format=ndjson&gzip=true" -H "Authorization: Bearer TOKEN"
+@router.get("/export", status_code=200)
+async def export(filters: Annotated[ExportFilter, Query()], seller: sellerDep):
+    export = ShipmentExport(filters)
+    return StreamingResponse(
+        export.stream(),
+        media_type=export.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{export.filename}"'},
+    )
+
+
+async def write(export: ShipmentExport, file) -> None:
+    started = time.perf_counter()
+    written = 0
+    async for chunk in export.stream():
+        file.write(chunk)
+        written += len(chunk)
+    elapsed = time.perf_counter() - started
+    # ru_maxrss is in KiB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(
+        f"{export.rows:,} rows, {written / 1e6:,.1f} MB in {elapsed:.1f}s: "
+        f"{export.rows / elapsed:,.0f} rows/s, peak RSS {peak:,.0f} MB",
+        file=sys.stderr,
+    )
+
+
+async def main(args: argparse.Namespace):
+    filters = ExportFilter(
+        status=args.status,
+        delivery_from=args.delivery_from,
+        delivery_to=args.delivery_to,
+        format=args.format,
+        gzip=args.gzip,
+    )
+    try:
+        if args.output == "-":
+            await write(ShipmentExport(filters, batch_size=args.batch_size), sys.stdout.buffer)
+        else:
+            with open(args.output, "wb") as file:
+                await write(ShipmentExport(filters, batch_size=args.batch_size), file)
+    finally:
+        await shards.dispose()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("-o", "--output", default="-")
+    parser.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--status", choices=[s.value for s in ShipmentStatus])
+    parser.add_argument("--delivery-from", type=datetime.datetime.fromisoformat)
+    parser.add_argument("--delivery-to", type=datetime.datetime.fromisoformat)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    asyncio.run(main(parser.parse_args()))
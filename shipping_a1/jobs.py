@@ -0,0 +1,17 @@
+import logging
+
+from common.jobs import jobs
+
+logger = logging.getLogger(__name__)
+
+
+@jobs.job("shipping_a1.seller_onboarding")
+async def seller_onboarding(seller_id: int, email: str):
+    # welcome mail, account setup and the like for a new seller
+    logger.info("onboarding seller %s (%s)", seller_id, email)
+
+
+@jobs.job("shipping_a1.shipment_notification")
+async def shipment_notification(shipment_id: int, status: str):
+    # tell the customer about a new shipment or a status change
+    logger.info("shipment %s is %s", shipment_id, status)
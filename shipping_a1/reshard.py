@@ -0,0 +1,134 @@
+"""Move shipments to the shard that owns their bucket, in batches.
+
+Placement comes from SHARD_URLS / SHARD_PLACEMENT, run the tool with the new
+values:
+
+    1. SHARD_URLS=... SHARD_PLACEMENT=... uv run python -m shipping_a1.reshard copy
+    2. deploy the new settings
+    3. run `copy` again, it picks up what was written to the old shards meanwhile
+    4. uv run python -m shipping_a1.reshard prune
+
+`copy` upserts, so it can be re-run at any time; `prune` deletes rows from
+shards that no longer own their bucket. Deletes made on the old shard between
+1 and 2 are not carried over, pause writes to the moving buckets if that
+matters. `--dry-run` only counts.
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+from sqlalchemy import delete, func, select, true, update
+
+from shipping_a1.shards import BUCKETS, shards, shipment_id_seq
+from shipping_a1.ship import Shipment, ShipmentService
+
+logger = logging.getLogger("shipping_a1.reshard")
+
+
+def foreign(shard: int):
+    """Rows on this shard whose bucket is placed elsewhere."""
+    owned = set(shards.owned(shard))
+    return (Shipment.id % BUCKETS).not_in(owned) if owned else true()
+
+
+async def counts() -> None:
+    for shard, maker in enumerate(shards.sessionmakers):
+        async with maker() as session:
+            statement = select(func.count()).select_from(Shipment).where(foreign(shard))
+            n = (await session.execute(statement)).scalar()
+            logger.info("shard %d: %d rows to move", shard, n)
+
+
+async def copy_ids(source: int) -> None:
+    # a bucket's counter has to be ahead of every id it handed out on any shard
+    async with shards.sessionmakers[source]() as session:
+        rows = (await session.execute(select(shipment_id_seq))).all()
+    for bucket, next_value in rows:
+        owner = shards.placement[bucket]
+        if owner == source:
+            continue
+        async with shards.sessionmakers[owner]() as session:
+            # SQLite spells GREATEST as a two-argument max()
+            sqlite = session.get_bind().dialect.name == "sqlite"
+            largest = func.max if sqlite else func.greatest
+            await session.execute(
+                update(shipment_id_seq)
+                .where(shipment_id_seq.c.bucket == bucket)
+                .values(next_value=largest(shipment_id_seq.c.next_value, next_value))
+            )
+            await session.commit()
+
+
+async def copy(batch_size: int) -> None:
+    for source, maker in enumerate(shards.sessionmakers):
+        await copy_ids(source)
+        moved, last, started = 0, 0, time.perf_counter()
+        async with maker() as session:
+            while True:
+                batch = (
+                    await session.execute(
+                        select(Shipment)
+                        .where(foreign(source), Shipment.id > last)
+                        .order_by(Shipment.id)
+                        .limit(batch_size)
+                    )
+                ).scalars().all()
+                if not batch:
+                    break
+                last = batch[-1].id
+                by_owner: dict[int, list[Shipment]] = {}
+                for item in batch:
+                    by_owner.setdefault(shards.shard_of(item.id), []).append(item)
+                for owner, items in by_owner.items():
+                    async with shards.sessionmakers[owner]() as target:
+                        await ShipmentService(target).upsert_many(items)
+                moved += len(batch)
+                logger.info(
+                    "shard %d: %d rows copied, %.0f rows/s",
+                    source, moved, moved / (time.perf_counter() - started),
+                )
+                # the source only reads, don't hold its snapshot across batches
+                await session.rollback()
+
+
+async def prune(batch_size: int) -> None:
+    for shard, maker in enumerate(shards.sessionmakers):
+        removed = 0
+        async with maker() as session:
+            while True:
+                ids = select(Shipment.id).where(foreign(shard)).limit(batch_size)
+                result = await session.execute(
+                    delete(Shipment).where(Shipment.id.in_(ids.scalar_subquery()))
+                )
+                await session.commit()
+                if not result.rowcount:
+                    break
+                removed += result.rowcount
+                logger.info("shard %d: %d rows pruned", shard, removed)
+
+
+async def main(args: argparse.Namespace):
+    try:
+        # new shards start empty, create their tables whatever SCHEMA_MODE says
+        await shards.init(dev=True)
+        if args.dry_run:
+            await counts()
+        elif args.command == "copy":
+            await copy(args.batch_size)
+        else:
+            await prune(args.batch_size)
+    finally:
+        await shards.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("command", choices=["copy", "prune"])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true")
+    asyncio.run(main(parser.parse_args()))
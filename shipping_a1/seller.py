@@ -1,3 +1,4 @@
+import logging
 from datetime import datetime, timedelta, timezone
 from typing import Annotated, ClassVar, Optional
 from uuid import uuid4
@@ -15,6 +16,8 @@ from pydantic import BaseModel
 from sqlalchemy import MetaData
 from sqlmodel import Field, SQLModel, select
 
+from common.jobs import jobs
+from common.repository import Repository
 from shipping_a1.db import (
     add_jti_to_blocklist,
     check_jti,
@@ -23,6 +26,8 @@ from shipping_a1.db import (
     shipping_a1_meta,
 )
 
+logger = logging.getLogger(__name__)
+
 pwd_cxt = CryptContext(schemes=["argon2"], deprecated="auto")
 oauth2_token = OAuth2PasswordBearer(tokenUrl="/shipping_a1/seller/login")
 
@@ -31,7 +36,7 @@ class Seller(SQLModel, table=True):
     metadata: ClassVar[MetaData] = shipping_a1_meta
     id: Optional[int] = Field(default=None, primary_key=True)
     username: str
-    email: str
+    email: str = Field(index=True)
     password: str
 
 
@@ -39,7 +44,7 @@ def generate_access_token(
     data: dict, expires_delta: Optional[timedelta] = timedelta(minutes=30)
 ):
     # to_encode = data.copy()
-    print(f"ENCODE: {data}")
+    logger.debug("token issued", extra={"email": data.get("email")})
     return jwt.encode(
         payload={
             **data,
@@ -85,7 +90,6 @@ sellerDep = Annotated[Seller, Depends(get_current_seller)]
 class AccessTokenBearer(HTTPBearer):
     async def __call__(self, request):
         auth_credentials = await super().__call__(request)
-        print("auth_credentials", auth_credentials)
         token = auth_credentials.credentials
         token_data = decode_access_token(token)
         if token_data is None:
@@ -95,9 +99,8 @@ class AccessTokenBearer(HTTPBearer):
 
 access_token_bearer = AccessTokenBearer()
 tokenBearerDep = Annotated[dict, Depends(access_token_bearer)]
-class SellerService:
-    def __init__(self, session: sessionDep):
-        self.session = session
+class SellerService(Repository[Seller]):
+    model = Seller
 
     async def authenticate(self, email: str, password: str):
         seller = await self.session.execute(select(Seller).where(Seller.email == email))
@@ -112,28 +115,28 @@ class SellerService:
             **seller.model_dump(exclude={"password"}, exclude_none=True),
             password=pwd_cxt.hash(seller.password),
         )
-        self.session.add(item)
-        await self.session.commit()
-        await self.session.refresh(item)
+        await self.save(item)
+        await jobs.enqueue("shipping_a1.seller_onboarding", seller_id=item.id, email=item.email)
         return item
 
     async def get_all(self):
         return await self.session.execute(select(Seller))
 
     async def get_by_id(self, id: int):
-        return await self.session.get(Seller, id)
+        return await self.get(id)
 
     async def update(self, id: int, seller: Seller):
-        item = await self.get_by_id(id)
-        item.sqlmodel_update(seller)
-        await self.session.commit()
-        await self.session.refresh(item)
+        item = await super().update(
+            id, seller.model_dump(exclude_unset=True, exclude={"id"})
+        )
+        if item is None:
+            raise HTTPException(status_code=404, detail="Seller not found")
         return item
 
     async def delete(self, id: int):
-        item = await self.get_by_id(id)
-        await self.session.delete(item)
-        await self.session.commit()
+        item = await super().delete(id)
+        if item is None:
+            raise HTTPException(status_code=404, detail="Seller not found")
         return item
 
 
@@ -183,5 +186,5 @@ async def dashboard2(token: decodeTokenDep):
 
 @router.get("/logout")
 async def logout(token: accessTokenDep):
-    await add_jti_to_blocklist(token["jti"])
+    await add_jti_to_blocklist(token["jti"], token["exp"])
     return {"msg": "logout", "deleted_token": token}
\ No newline at end of file
@@ -0,0 +1,114 @@
+import asyncio
+import random
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
+
+from sqlalchemy import Column, Connection, Integer, Table, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from common.schema import Schema
+from shipping_a1.db import BUCKETS, SHARD_BITS, engine, settings, shipping_a1_meta
+
+# Shipments are spread over BUCKETS logical buckets. The low SHARD_BITS bits of
+# a shipment id name its bucket and every bucket lives on one shard (database),
+# so any id routes without a lookup. Placement maps buckets to shards,
+# resharding moves whole buckets and ids never change.
+#
+# Ids are allocated per bucket from shipment_id_seq, a counter row that lives
+# on the bucket's shard and is bumped in the same transaction as the INSERT.
+# 26 bits of sequence per bucket keep ids inside a 32-bit INTEGER.
+
+shipment_id_seq = Table(
+    "shipment_id_seq",
+    shipping_a1_meta,
+    Column("bucket", Integer, primary_key=True, autoincrement=False),
+    Column("next_value", Integer, nullable=False),
+)
+
+T = TypeVar("T")
+
+
+def bucket_of(id: int) -> int:
+    return id & (BUCKETS - 1)
+
+
+def seed_id_sequence(connection: Connection) -> None:
+    # ids handed out before sharding are below every seeded counter
+    shipment = shipping_a1_meta.tables["shipment"]
+    start = (connection.execute(select(func.max(shipment.c.id))).scalar() or 0) >> SHARD_BITS
+    existing = set(connection.execute(select(shipment_id_seq.c.bucket)).scalars())
+    missing = [{"bucket": b, "next_value": start + 1} for b in range(BUCKETS) if b not in existing]
+    if missing:
+        connection.execute(insert(shipment_id_seq), missing)
+
+
+async def next_shipment_id(session: AsyncSession, bucket: int) -> int:
+    result = await session.execute(
+        update(shipment_id_seq)
+        .where(shipment_id_seq.c.bucket == bucket)
+        .values(next_value=shipment_id_seq.c.next_value + 1)
+        .returning(shipment_id_seq.c.next_value - 1)
+    )
+    return (result.scalar_one() << SHARD_BITS) | bucket
+
+
+class Shards:
+    def __init__(self, engines: list[AsyncEngine], placement: dict[int, int]):
+        self.engines = engines
+        self.sessionmakers = [
+            async_sessionmaker(e, class_=AsyncSession, expire_on_commit=False) for e in engines
+        ]
+        self.placement = [placement.get(b, b % len(engines)) for b in range(BUCKETS)]
+        self.schemas = [
+            Schema(f"shipping_a1.shard{i}", e, shipping_a1_meta, create=seed_id_sequence)
+            for i, e in enumerate(engines)
+        ]
+
+    def __len__(self) -> int:
+        return len(self.engines)
+
+    def shard_of(self, id: int) -> int:
+        return self.placement[bucket_of(id)]
+
+    def new_bucket(self) -> int:
+        return random.randrange(BUCKETS)
+
+    def owned(self, shard: int) -> list[int]:
+        return [b for b in range(BUCKETS) if self.placement[b] == shard]
+
+    async def init(self, dev: bool | None = None) -> None:
+        for schema in self.schemas:
+            await schema.ensure(dev)
+
+    async def dispose(self) -> None:
+        for e in self.engines:
+            if e is not engine:
+                await e.dispose()
+
+
+class ShardSessions:
+    """The sessions of one request, opened on first use and closed together."""
+
+    def __init__(self, shards: Shards):
+        self.shards = shards
+        self._open: dict[int, AsyncSession] = {}
+
+    def __getitem__(self, shard: int) -> AsyncSession:
+        if shard not in self._open:
+            self._open[shard] = self.shards.sessionmakers[shard]()
+        return self._open[shard]
+
+    async def gather(self, call: Callable[[AsyncSession], Awaitable[T]]) -> list[T]:
+        """Run call on every shard at the same time, results in shard order."""
+        return await asyncio.gather(*(call(self[s]) for s in range(len(self.shards))))
+
+    async def close(self) -> None:
+        await asyncio.gather(*(s.close() for s in self._open.values()))
+        self._open.clear()
+
+
+shards = Shards(
+    [create_async_engine(u, echo=True) for u in settings.SHARD_URLS] or [engine],
+    settings.SHARD_PLACEMENT,
+)
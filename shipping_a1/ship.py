@@ -1,17 +1,34 @@
+import base64
+import binascii
 import datetime
 from enum import Enum
 from random import randint
 from typing import Annotated, ClassVar, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from pydantic import Field as PydanticField
 
 # from pydantic import BaseModel
-from sqlalchemy import MetaData
+from sqlalchemy import Index, MetaData, Select, func, tuple_
+from sqlalchemy import update as update_query
 from sqlmodel import Field, SQLModel, select
 
-from shipping_a1.db import sessionDep, shipping_a1_meta
+from common.estimate import estimate_count
+from common.jobs import jobs
+from common.projection import FieldSet, Projection, json_response, projection
+from common.repository import Repository
+from shipping_a1.db import shipping_a1_meta
+from shipping_a1.events import EVENT_ID, shipment_events
 from shipping_a1.seller import sellerDep
+from shipping_a1.shards import ShardSessions, next_shipment_id, shards
+from shipping_a1.stats import (
+    Aggregates,
+    ShipmentFacts,
+    ShipmentStatsRead,
+    shipment_stats,
+)
 
 
 def random_destination():
@@ -38,10 +55,19 @@ class BaseShipment(SQLModel):
 
 
 class Shipment(BaseShipment, table=True):
+    # search pages are ordered by (estimated_delivery, id), equality filters go first
+    __table_args__ = (
+        Index("ix_shipment_status_delivery", "status", "estimated_delivery", "id"),
+        Index("ix_shipment_destination_delivery", "destination", "estimated_delivery", "id"),
+        Index("ix_shipment_delivery", "estimated_delivery", "id"),
+    )
     id: int | None = Field(default=None, primary_key=True)
     status: ShipmentStatus = Field(default=ShipmentStatus.placed)
     estimated_delivery: datetime.datetime = Field(default_factory=datetime.datetime.now)
 
+shipment_rows = projection(Shipment)
+
+
 class CreateShipment(BaseModel):
     content: str
     weight: float
@@ -57,57 +83,278 @@ class UpdateShipment(BaseModel):
     status: ShipmentStatus
 
 
-class ShipmentService:
-    def __init__(self, session: sessionDep):
-        self.session = session
+class ShipmentFilter(BaseModel):
+    status: ShipmentStatus | None = None
+    # estimated_delivery in [delivery_from, delivery_to)
+    delivery_from: datetime.datetime | None = None
+    delivery_to: datetime.datetime | None = None
+    destination: int | None = None
+    min_weight: float | None = None
+    max_weight: float | None = None
+    limit: int = PydanticField(default=50, gt=0, le=500)
+    cursor: str | None = None
+    count: bool = False
 
-    async def create(self, data: CreateShipment) -> Shipment:
+
+class ShipmentPage(BaseModel):
+    items: list[Shipment]
+    next_cursor: str | None = None
+    # planner estimate on Postgres, only when asked for with count=true
+    total: int | None = None
+
+
+def encode_cursor(shipment: Shipment) -> str:
+    raw = f"{shipment.estimated_delivery.isoformat()}|{shipment.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, int]:
+    try:
+        delivery, id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.datetime.fromisoformat(delivery), int(id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+class ShipmentService(Repository[Shipment]):
+    model = Shipment
+
+    async def create(self, data: CreateShipment, bucket: int | None = None) -> Shipment:
+        if bucket is None:
+            bucket = shards.new_bucket()
         shipment = Shipment(
+            id=await next_shipment_id(self.session, bucket),
             **data.model_dump(
                 exclude={"id", "estimated_delivery", "status"}, exclude_none=True
             ),
             status=ShipmentStatus.placed,
             estimated_delivery=datetime.datetime.now(),
         )
-        self.session.add(shipment)
-        await self.session.commit()
-        await self.session.refresh(shipment)
+        await self.save(shipment)
+        await shipment_stats.record(None, facts(shipment))
+        await jobs.enqueue(
+            "shipping_a1.shipment_notification",
+            shipment_id=shipment.id,
+            status=ShipmentStatus(shipment.status).value,
+        )
         return shipment
 
-    async def get_all(self) -> list[Shipment]:
-        items = await self.session.execute(select(Shipment))
-        return items.scalars().all()
+    async def get_all(self, rows: Projection = shipment_rows) -> list:
+        # rows, not Shipment instances: nothing lands in the identity map
+        return await rows.all(self.session)
+
+    @staticmethod
+    def search_statement(filters: ShipmentFilter) -> Select:
+        statement = select(Shipment)
+        if filters.status is not None:
+            statement = statement.where(Shipment.status == filters.status)
+        if filters.destination is not None:
+            statement = statement.where(Shipment.destination == filters.destination)
+        if filters.delivery_from is not None:
+            statement = statement.where(Shipment.estimated_delivery >= filters.delivery_from)
+        if filters.delivery_to is not None:
+            statement = statement.where(Shipment.estimated_delivery < filters.delivery_to)
+        if filters.min_weight is not None:
+            statement = statement.where(Shipment.weight >= filters.min_weight)
+        if filters.max_weight is not None:
+            statement = statement.where(Shipment.weight <= filters.max_weight)
+        return statement.order_by(Shipment.estimated_delivery, Shipment.id)
+
+    async def search(self, filters: ShipmentFilter) -> ShipmentPage:
+        statement = self.search_statement(filters)
+        page = statement
+        if filters.cursor:
+            page = page.where(
+                tuple_(Shipment.estimated_delivery, Shipment.id)
+                > tuple_(*decode_cursor(filters.cursor))
+            )
+        # one extra row tells whether there is a next page
+        items = (await self.session.execute(page.limit(filters.limit + 1))).scalars().all()
+        next_cursor = None
+        if len(items) > filters.limit:
+            items = items[: filters.limit]
+            next_cursor = encode_cursor(items[-1])
+        total = await estimate_count(self.session, statement) if filters.count else None
+        return ShipmentPage(items=items, next_cursor=next_cursor, total=total)
 
     async def get_id(self, id: int) -> Shipment:
         # item = await self.session.execute(select(Shipment).where(Shipment.id == id))
         # item = item.scalars().first()
-        item = await self.session.get(Shipment, id)
+        item = await self.get(id)
         if item is None:
             raise HTTPException(status_code=404, detail="Shipment not found")
         return item
 
+    async def get_row(self, id: int, rows: Projection):
+        found = await rows.all(self.session, rows.statement.where(Shipment.id == id))
+        if not found:
+            raise HTTPException(status_code=404, detail="Shipment not found")
+        return found[0]
+
+    async def _update_returning_old(self, id: int, values: dict):
+        old = (
+            select(Shipment.id, Shipment.status, Shipment.destination, Shipment.weight)
+            .where(Shipment.id == id)
+            .with_for_update()
+            .cte("old")
+        )
+        statement = (
+            update_query(Shipment)
+            .values(**values)
+            .execution_options(synchronize_session=False, populate_existing=True)
+        )
+        if self.session.bind.dialect.name == "postgresql":
+            # one statement: the CTE shares the UPDATE's snapshot, so it
+            # returns the row as it was before the write
+            result = await self.session.execute(
+                statement.where(Shipment.id == old.c.id).returning(
+                    Shipment, old.c.status, old.c.destination, old.c.weight
+                )
+            )
+            return result.one_or_none()
+        # SQLite evaluates the CTE after the write, read the old row first
+        previous = (await self.session.execute(select(old))).one_or_none()
+        if previous is None:
+            return None
+        result = await self.session.execute(
+            statement.where(Shipment.id == id).returning(Shipment)
+        )
+        return (result.scalar_one(), *previous[1:])
+
     async def update(self, id: int, shipment: dict) -> Shipment:
-        # item = await self.session.get(Shipment, id)
-        item = await self.get_id(id)
-        item.sqlmodel_update(shipment)
-        self.session.add(item)
-        await self.session.commit()
-        await self.session.refresh(item)
+        # stats and events need the values from before the update
+        async with self.unit_of_work():
+            row = await self._update_returning_old(id, shipment)
+        if row is None:
+            raise HTTPException(status_code=404, detail="Shipment not found")
+        item, status, destination, weight = row
+        before = ShipmentFacts(ShipmentStatus(status).value, destination, weight)
+        after = facts(item)
+        await shipment_stats.record(before, after)
+        if after.status != before.status:
+            await shipment_events.publish(id, after.status, before.status)
+            await jobs.enqueue(
+                "shipping_a1.shipment_notification", shipment_id=id, status=after.status
+            )
         return item
 
     async def delete(self, id: int) -> None:
         # item = await self.get_id(id)
         # await self.session.delete(item)
         # await self.session.commit()
-        await self.session.delete(await self.get_id(id))
-        await self.session.commit()
+        item = await super().delete(id)
+        if item is None:
+            raise HTTPException(status_code=404, detail="Shipment not found")
+        await shipment_stats.record(facts(item), None)
         return {"detail": f"Shipment ID: {id} deleted"}
 
-def shipment_callback(session: sessionDep):
-    return ShipmentService(session)
+    async def aggregates(self) -> Aggregates:
+        totals = await self.session.execute(
+            select(func.count(), func.coalesce(func.sum(Shipment.weight), 0.0))
+        )
+        total, weight_sum = totals.one()
+        by_status = await self.session.execute(
+            select(Shipment.status, func.count()).group_by(Shipment.status)
+        )
+        by_destination = await self.session.execute(
+            select(Shipment.destination, func.count()).group_by(Shipment.destination)
+        )
+        return Aggregates(
+            total=total,
+            weight_sum=weight_sum,
+            by_status={ShipmentStatus(status).value: n for status, n in by_status},
+            by_destination=dict(by_destination.all()),
+        )
+
+
+class ShardedShipmentService:
+    """ShipmentService over all shards: by-id calls go to the shard that owns
+    the id, listings and aggregates query every shard concurrently."""
+
+    def __init__(self, sessions: ShardSessions):
+        self.sessions = sessions
+
+    def on(self, shard: int) -> ShipmentService:
+        return ShipmentService(self.sessions[shard])
+
+    def for_id(self, id: int) -> ShipmentService:
+        return self.on(shards.shard_of(id))
+
+    async def create(self, data: CreateShipment) -> Shipment:
+        bucket = shards.new_bucket()
+        return await self.on(shards.placement[bucket]).create(data, bucket)
+
+    async def get_id(self, id: int) -> Shipment:
+        return await self.for_id(id).get_id(id)
+
+    async def update(self, id: int, shipment: dict) -> Shipment:
+        return await self.for_id(id).update(id, shipment)
+
+    async def delete(self, id: int) -> dict[str, str]:
+        return await self.for_id(id).delete(id)
+
+    async def get_row(self, id: int, rows: Projection):
+        return await self.for_id(id).get_row(id, rows)
 
+    async def get_all(self, rows: Projection = shipment_rows) -> list:
+        results = await self.sessions.gather(lambda s: ShipmentService(s).get_all(rows))
+        return [item for items in results for item in items]
 
-serviceDep = Annotated[ShipmentService, Depends(shipment_callback)]
+    async def search(self, filters: ShipmentFilter) -> ShipmentPage:
+        # every shard returns its first `limit` rows after the cursor, the
+        # global page is the first `limit` of their merge
+        pages = await self.sessions.gather(lambda s: ShipmentService(s).search(filters))
+        items = sorted(
+            (item for page in pages for item in page.items),
+            key=lambda item: (item.estimated_delivery, item.id),
+        )
+        next_cursor = None
+        if len(items) > filters.limit or any(page.next_cursor for page in pages):
+            items = items[: filters.limit]
+            next_cursor = encode_cursor(items[-1])
+        total = sum(page.total for page in pages) if filters.count else None
+        return ShipmentPage(items=items, next_cursor=next_cursor, total=total)
+
+    async def aggregates(self) -> Aggregates:
+        merged = Aggregates()
+        for part in await self.sessions.gather(lambda s: ShipmentService(s).aggregates()):
+            merged.total += part.total
+            merged.weight_sum += part.weight_sum
+            for key, n in part.by_status.items():
+                merged.by_status[key] = merged.by_status.get(key, 0) + n
+            for key, n in part.by_destination.items():
+                merged.by_destination[key] = merged.by_destination.get(key, 0) + n
+        return merged
+
+    async def close(self) -> None:
+        await self.sessions.close()
+
+
+def facts(shipment: Shipment) -> ShipmentFacts:
+    return ShipmentFacts(
+        ShipmentStatus(shipment.status).value, shipment.destination, shipment.weight
+    )
+
+
+async def aggregate_shipments() -> Aggregates:
+    # full GROUP BY pass for the stats reconciler, outside of any request
+    service = ShardedShipmentService(ShardSessions(shards))
+    try:
+        return await service.aggregates()
+    finally:
+        await service.close()
+
+async def shipment_callback():
+    service = ShardedShipmentService(ShardSessions(shards))
+    try:
+        yield service
+    finally:
+        await service.close()
+
+
+serviceDep = Annotated[ShardedShipmentService, Depends(shipment_callback)]
+# ?fields=status,estimated_delivery selects only those columns
+fieldsDep = Annotated[Projection, Depends(FieldSet(Shipment))]
 
 
 @router.post("/add", status_code=201)
@@ -118,15 +365,54 @@ async def create_shipment(
 
 
 @router.get("/all", status_code=200)
-async def get_all(service: serviceDep, seller: sellerDep) -> list[Shipment]:
-    return await service.get_all()
+async def get_all(service: serviceDep, seller: sellerDep, fields: fieldsDep) -> list[Shipment]:
+    return json_response(await service.get_all(fields))
+
+
+@router.get("/stats", status_code=200)
+async def stats(seller: sellerDep) -> ShipmentStatsRead:
+    return await shipment_stats.read()
+
+
+# curl "127.0.0.1:8000/shipping_a1/ship/search?status=in_transit&delivery_from=2026-10-19&delivery_to=2026-10-20" -H "Authorization: Bearer TOKEN"
+@router.get("/search", status_code=200)
+async def search(
+    filters: Annotated[ShipmentFilter, Query()], service: serviceDep, seller: sellerDep
+) -> ShipmentPage:
+    return await service.search(filters)
 
 
 @router.get("/{id}", response_model=Shipment, status_code=200)
-async def get_id(id: int, service: serviceDep, seller: sellerDep) -> Shipment:
+async def get_id(id: int, service: serviceDep, seller: sellerDep, fields: fieldsDep) -> Shipment:
+    if fields is not shipment_rows:
+        return json_response(await service.get_row(id, fields))
     return await service.get_id(id)
 
 
+# curl -N 127.0.0.1:8000/shipping_a1/ship/1/events -H "Authorization: Bearer TOKEN"
+@router.get("/{id}/events", status_code=200)
+async def events(
+    id: int,
+    service: serviceDep,
+    seller: sellerDep,
+    last_event_id: Annotated[str | None, Header()] = None,
+):
+    await service.get_id(id)
+    # the stream stays open for a long time, don't keep a pooled connection
+    await service.close()
+    if last_event_id is not None and not EVENT_ID.match(last_event_id):
+        raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    if not shipment_events.has_capacity():
+        raise HTTPException(
+            status_code=503, detail="Too many event streams", headers={"Retry-After": "5"}
+        )
+    return StreamingResponse(
+        shipment_events.stream(id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.put("/update", status_code=200)
 async def update(data: Shipment, service: serviceDep, seller: sellerDep) -> Shipment:
     return await service.update(data.id, data.model_dump(exclude={"id"}))
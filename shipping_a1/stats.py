@@ -0,0 +1,185 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, NamedTuple
+
+from pydantic import BaseModel
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from shipping_a1.db import settings, token_blacklist
+
+logger = logging.getLogger(__name__)
+
+# Running aggregates over the shipment table, kept in Redis hashes and moved by
+# every ShipmentService write, so reading them is O(1) instead of a GROUP BY.
+# A delta that never reached Redis (Redis down, worker killed after commit) is
+# drift; the reconciler recomputes everything from Postgres every
+# STATS_RECONCILE_INTERVAL seconds, one worker per round.
+#
+# A round sets the rebuild flag first, then aggregates. From then on record()
+# applies each delta to the live hashes and to shadow ones, so the shadows
+# hold what was written since; the round adds the aggregate to them and
+# RENAMEs them over the live hashes in one script. A delta is not lost or
+# doubled unless its commit lands before the aggregate's snapshot and its
+# record() after the flag, a window of one write.
+
+# KEYS: live totals, status, destination, the rebuild flag, shadow totals,
+# status, destination. ARGV: count, weight, then (2 or 3, field, delta)
+# triples for the status (KEYS[2]) and destination (KEYS[3]) hashes.
+_RECORD = """
+local targets = {0}
+if redis.call('EXISTS', KEYS[4]) == 1 then targets[2] = 4 end
+for _, o in ipairs(targets) do
+    redis.call('HINCRBY', KEYS[1 + o], 'count', ARGV[1])
+    redis.call('HINCRBYFLOAT', KEYS[1 + o], 'weight_sum', ARGV[2])
+    for i = 3, #ARGV, 3 do
+        redis.call('HINCRBY', KEYS[tonumber(ARGV[i]) + o], ARGV[i + 1], ARGV[i + 2])
+    end
+end
+"""
+
+# KEYS: the rebuild flag, then (shadow, live) pairs. Without the flag (it
+# expired, the round ran too long) the shadows missed deltas: keep the live ones
+_SWAP = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+for i = 2, #KEYS, 2 do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('RENAME', KEYS[i], KEYS[i + 1])
+    else
+        redis.call('DEL', KEYS[i + 1])
+    end
+end
+redis.call('DEL', KEYS[1])
+return 1
+"""
+
+
+class ShipmentFacts(NamedTuple):
+    status: str
+    destination: int
+    weight: float
+
+
+class Aggregates(BaseModel):
+    total: int = 0
+    weight_sum: float = 0.0
+    by_status: dict[str, int] = {}
+    by_destination: dict[int, int] = {}
+
+
+class ShipmentStatsRead(BaseModel):
+    total: int
+    average_weight: float | None
+    by_status: dict[str, int]
+    by_destination: dict[int, int]
+
+
+def _text(value: bytes | str) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class ShipmentStats:
+    def __init__(self, redis: Redis, namespace: str, reconcile_interval: int):
+        self.redis = redis
+        self.reconcile_interval = reconcile_interval
+        self.totals_key = f"{namespace}:totals"
+        self.status_key = f"{namespace}:status"
+        self.destination_key = f"{namespace}:destination"
+        self.lock_key = f"{namespace}:reconcile_lock"
+        self.rebuild_key = f"{namespace}:rebuilding"
+        self.live = (self.totals_key, self.status_key, self.destination_key)
+        self.shadow = tuple(f"{key}:rebuild" for key in self.live)
+        self._record = redis.register_script(_RECORD)
+        self._swap = redis.register_script(_SWAP)
+        self._reconciler: asyncio.Task | None = None
+
+    async def record(self, old: ShipmentFacts | None, new: ShipmentFacts | None) -> None:
+        """Apply one write: create (None, new), update (old, new), delete (old, None)."""
+        if old == new:
+            return
+        count, weight, fields = 0, 0.0, []
+        for facts, sign in ((old, -1), (new, 1)):
+            if facts is None:
+                continue
+            count += sign
+            weight += sign * facts.weight
+            fields += [2, facts.status, sign, 3, facts.destination, sign]
+        try:
+            await self._record(
+                keys=[*self.live, self.rebuild_key, *self.shadow], args=[count, weight, *fields]
+            )
+        except RedisError as e:
+            # the write itself is committed, the reconciler will catch up
+            logger.warning("shipment stats not updated: %s", e)
+
+    async def read(self) -> ShipmentStatsRead:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hgetall(self.totals_key)
+            pipe.hgetall(self.status_key)
+            pipe.hgetall(self.destination_key)
+            totals, by_status, by_destination = await pipe.execute()
+        totals = {_text(k): float(v) for k, v in totals.items()}
+        total = int(totals.get("count", 0))
+        return ShipmentStatsRead(
+            total=total,
+            average_weight=totals.get("weight_sum", 0.0) / total if total else None,
+            by_status={_text(k): int(v) for k, v in by_status.items() if int(v)},
+            by_destination={int(k): int(v) for k, v in by_destination.items() if int(v)},
+        )
+
+    async def rebuild(self, aggregate: Callable[[], Awaitable[Aggregates]]) -> None:
+        """Recompute from `aggregate`, keeping the deltas recorded meanwhile."""
+        totals, status, destination = self.shadow
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(*self.shadow)
+            pipe.set(self.rebuild_key, "1", ex=self.reconcile_interval)
+            await pipe.execute()
+        aggregates = await aggregate()
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hincrby(totals, "count", aggregates.total)
+            pipe.hincrbyfloat(totals, "weight_sum", aggregates.weight_sum)
+            for field, value in aggregates.by_status.items():
+                pipe.hincrby(status, field, value)
+            for field, value in aggregates.by_destination.items():
+                pipe.hincrby(destination, str(field), value)
+            await pipe.execute()
+        swapped = await self._swap(
+            keys=[self.rebuild_key, *(key for pair in zip(self.shadow, self.live) for key in pair)]
+        )
+        if not swapped:
+            await self.redis.delete(*self.shadow)
+            raise RuntimeError("aggregation outlasted STATS_RECONCILE_INTERVAL, stats not replaced")
+
+    # * reconciliation
+
+    def start(self, aggregate: Callable[[], Awaitable[Aggregates]]) -> None:
+        if self._reconciler is None:
+            self._reconciler = asyncio.create_task(self._reconcile_forever(aggregate))
+
+    async def stop(self) -> None:
+        if self._reconciler is not None:
+            self._reconciler.cancel()
+            try:
+                await self._reconciler
+            except asyncio.CancelledError:
+                pass
+            self._reconciler = None
+
+    async def _reconcile_forever(self, aggregate) -> None:
+        interval = self.reconcile_interval
+        while True:
+            try:
+                # the lock expires with the round, whichever worker gets it does the work
+                if await self.redis.set(self.lock_key, "1", nx=True, ex=interval):
+                    await self.rebuild(aggregate)
+                    logger.info("shipment stats reconciled")
+            except Exception:
+                logger.exception("shipment stats reconciliation failed")
+            await asyncio.sleep(interval)
+
+
+shipment_stats = ShipmentStats(
+    token_blacklist,
+    namespace="shipping_a1:stats",
+    reconcile_interval=settings.STATS_RECONCILE_INTERVAL,
+)
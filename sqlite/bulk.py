@@ -0,0 +1,193 @@
+"""Stream CSV or NDJSON in and out of the sqlite/s3.db tables.
+
+    python -m sqlite.bulk import users users.csv
+    python -m sqlite.bulk import todo todo.ndjson --drop-indexes
+    python -m sqlite.bulk export users -            # CSV to stdout
+    python -m sqlite.bulk export todo todo.ndjson
+
+The format comes from the file extension, `--format` overrides it (and is
+needed for stdin/stdout, which default to CSV). Imports insert batches with
+executemany, one transaction per batch; a failed batch rolls back alone and
+stops the import, earlier batches stay. Exports read with fetchmany, memory
+does not grow with the table.
+"""
+
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager, nullcontext
+from itertools import islice
+from pathlib import Path
+from typing import TextIO
+
+from common.sqlite import connect
+from sqlite.db import PATH, create_tables
+
+TABLES = ("users", "todo")
+FORMATS = ("csv", "ndjson")
+PROGRESS_EVERY = 1.0
+
+
+def columns(connection: sqlite3.Connection, table: str) -> list[str]:
+    return [row[1] for row in connection.execute(f"PRAGMA table_info({table})")]
+
+
+def read_rows(file: TextIO, format: str, names: list[str]) -> Iterator[tuple]:
+    # missing fields and empty CSV cells become NULL, unknown fields are ignored
+    if format == "csv":
+        for record in csv.DictReader(file):
+            yield tuple(record.get(name) or None for name in names)
+    else:
+        for line in file:
+            if line.strip():
+                record = json.loads(line)
+                yield tuple(record.get(name) for name in names)
+
+
+def write_rows(file: TextIO, format: str, names: list[str], rows: Iterable[tuple]) -> Iterator[int]:
+    """Write batches of rows, yielding the size of each batch once written."""
+    if format == "csv":
+        writer = csv.writer(file)
+        writer.writerow(names)
+        for batch in rows:
+            writer.writerows(batch)
+            yield len(batch)
+    else:
+        for batch in rows:
+            file.writelines(json.dumps(dict(zip(names, row))) + "\n" for row in batch)
+            yield len(batch)
+
+
+def batches(rows: Iterable[tuple], size: int) -> Iterator[list[tuple]]:
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+@contextmanager
+def indexes_dropped(connection: sqlite3.Connection, table: str):
+    """Drop the table's indexes, create them again on the way out."""
+    # sql is NULL for the automatic indexes of PRIMARY KEY / UNIQUE, those stay
+    indexes = connection.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (table,),
+    ).fetchall()
+    with connection:
+        for name, _ in indexes:
+            connection.execute(f'DROP INDEX "{name}"')
+    try:
+        yield
+    finally:
+        started = time.perf_counter()
+        with connection:
+            for _, sql in indexes:
+                connection.execute(sql)
+        if indexes:
+            log(f"{len(indexes)} indexes rebuilt in {time.perf_counter() - started:.1f}s")
+
+
+class Progress:
+    def __init__(self, action: str):
+        self.action = action
+        self.count = 0
+        self.started = self.shown = time.perf_counter()
+
+    def add(self, n: int) -> None:
+        self.count += n
+        now = time.perf_counter()
+        if now - self.shown >= PROGRESS_EVERY:
+            self.shown = now
+            self.show()
+
+    def show(self) -> None:
+        elapsed = time.perf_counter() - self.started
+        rate = self.count / elapsed if elapsed else 0
+        log(f"{self.action} {self.count:,} rows, {elapsed:.1f}s, {rate * 60:,.0f} rows/min")
+
+
+def log(message: str) -> None:
+    print(message, file=sys.stderr)
+
+
+def import_rows(
+    connection: sqlite3.Connection,
+    table: str,
+    file: TextIO,
+    format: str,
+    batch_size: int = 10_000,
+    drop_indexes: bool = False,
+) -> int:
+    names = columns(connection, table)
+    statement = f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})"
+    progress = Progress("imported")
+    with indexes_dropped(connection, table) if drop_indexes else nullcontext():
+        for batch in batches(read_rows(file, format, names), batch_size):
+            with connection:
+                connection.executemany(statement, batch)
+            progress.add(len(batch))
+    progress.show()
+    return progress.count
+
+
+def export_rows(
+    connection: sqlite3.Connection,
+    table: str,
+    file: TextIO,
+    format: str,
+    batch_size: int = 10_000,
+) -> int:
+    names = columns(connection, table)
+    cursor = connection.execute(f"SELECT {', '.join(names)} FROM {table}")
+    progress = Progress("exported")
+    for n in write_rows(file, format, names, iter(lambda: cursor.fetchmany(batch_size), [])):
+        progress.add(n)
+    progress.show()
+    return progress.count
+
+
+@contextmanager
+def open_file(path: str, mode: str):
+    if path == "-":
+        yield sys.stdin if mode == "r" else sys.stdout
+    else:
+        with open(path, mode, newline="", encoding="utf-8") as file:
+            yield file
+
+
+def file_format(path: str, format: str | None) -> str:
+    if format:
+        return format
+    return "ndjson" if Path(path).suffix in (".ndjson", ".jsonl") else "csv"
+
+
+def main(args: argparse.Namespace):
+    connection = connect(args.database)
+    create_tables(connection)
+    format = file_format(args.file, args.format)
+    try:
+        if args.command == "import":
+            with open_file(args.file, "r") as file:
+                import_rows(connection, args.table, file, format, args.batch_size, args.drop_indexes)
+        else:
+            with open_file(args.file, "w") as file:
+                export_rows(connection, args.table, file, format, args.batch_size)
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("table", choices=TABLES)
+    parser.add_argument("file", help="path, or - for stdin/stdout")
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--database", default=PATH)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--drop-indexes", action="store_true")
+    main(parser.parse_args())
@@ -1,11 +1,19 @@
-import sqlite3
+# run from the repository root: python -m sqlite.db
+from common.sqlite import connect
 
-connection = sqlite3.connect("sqlite/s3.db")
-cursor = connection.cursor()
+PATH = "sqlite/s3.db"
 
-cursor.execute(
-    "CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, name TEXT, email TEXT)"
-)
-cursor.execute("CREATE TABLE todo (id INTEGER, task TEXT, complete BOOLEAN)")
 
-connection.close()
+def create_tables(connection):
+    cursor = connection.cursor()
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, name TEXT, email TEXT)"
+    )
+    cursor.execute("CREATE TABLE IF NOT EXISTS todo (id INTEGER, task TEXT, complete BOOLEAN)")
+    cursor.close()
+
+
+if __name__ == "__main__":
+    connection = connect(PATH)
+    create_tables(connection)
+    connection.close()
@@ -1,17 +1,18 @@
 from typing import Annotated
 
 from fastapi import Depends
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, create_engine
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.orm import Session
+
+from common.sqlite import SQLiteDatabase
 
 # ! create Database
 SQLALCHEMY_DATABASE_URL = "sqlite:///todo_a1/todo.db"
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+database = SQLiteDatabase(SQLALCHEMY_DATABASE_URL)
+engine = database.write_engine
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = database.sessionmaker(autocommit=False, autoflush=False)
 
 Base = declarative_base()
 
@@ -37,7 +38,7 @@ class Todos(Base):
     description = Column(String)
     priority = Column(Integer)
     complete = Column(Boolean, default=False)
-    owner_id = Column(Integer, ForeignKey("users.id"))
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
 
 
 # # 3. get from db
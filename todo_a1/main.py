@@ -1,6 +1,7 @@
 from fastapi import APIRouter
 from fastapi.responses import HTMLResponse
 
+from common.schema import create_missing_indexes
 from todo_a1.auth import router as auth_router
 from todo_a1.db import Base, engine
 
@@ -9,6 +10,8 @@ from todo_a1.todo import router as todo_router
 
 # run server
 Base.metadata.create_all(bind=engine)
+with engine.begin() as connection:
+    create_missing_indexes(connection, Base.metadata)
 
 router = APIRouter(prefix="/todo_a1", tags=["todo_a1"])
 router.include_router(todo_router)
@@ -2,10 +2,12 @@ from fastapi import APIRouter, Path
 from fastapi.exceptions import HTTPException
 from pydantic import BaseModel, Field
 
+from common.projection import json_response, projection
 from todo_a1.auth import auth_dependency
 from todo_a1.db import Todos, db_dependency
 
 router = APIRouter()
+todo_rows = projection(Todos)
 
 
 class TodoRequest(BaseModel):
@@ -31,7 +33,7 @@ async def create_todo(
 
 @router.get("/")
 async def read_all(db: db_dependency, auth: auth_dependency):
-    return db.query(Todos).all()
+    return json_response(todo_rows.all_sync(db))
 
 
 @router.get("/task/{id}", status_code=200)
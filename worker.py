@@ -0,0 +1,44 @@
+import argparse
+import asyncio
+import json
+import logging
+
+from common.jobs import jobs
+
+# handlers register themselves on import
+import book_a1.jobs  # noqa: F401
+import shipping_a1.jobs  # noqa: F401
+
+# run: uv run python worker.py --concurrency 16
+# metrics: uv run python worker.py --metrics
+
+
+async def report(interval: int):
+    last = None
+    while True:
+        await asyncio.sleep(interval)
+        metrics = await jobs.metrics()
+        if last is not None:
+            rate = (metrics["processed"] - last) / interval
+            logging.info("%.1f jobs/s, lag %s, pending %s", rate, metrics["lag"], metrics["pending"])
+        last = metrics["processed"]
+
+
+async def main(args: argparse.Namespace):
+    if args.metrics:
+        print(json.dumps(await jobs.metrics(), indent=2))
+        return
+    reporter = asyncio.create_task(report(args.report_interval))
+    try:
+        await jobs.work(args.concurrency)
+    finally:
+        reporter.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="background job worker")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--report-interval", type=int, default=30)
+    parser.add_argument("--metrics", action="store_true")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    asyncio.run(main(parser.parse_args()))